@@ -1,7 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
-from datetime import timedelta, datetime, date
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, Response, stream_with_context, make_response, abort
+from datetime import timedelta, datetime, date, timezone
 import calendar
+import re
+import bisect
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text, func, and_, or_, case, select, bindparam, cast, tuple_, literal, literal_column, Integer, Float
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.exc import IntegrityError
 import os
 import shutil
 import zipfile
@@ -9,9 +15,19 @@ import glob
 from apscheduler.schedulers.background import BackgroundScheduler
 from werkzeug.utils import secure_filename
 from PIL import Image
-from functools import wraps
-import pandas as pd
-from io import BytesIO
+from functools import wraps, lru_cache, partial
+import numpy as np
+from io import BytesIO, StringIO
+import csv
+import tempfile
+import threading
+import multiprocessing
+import hashlib
+import json
+import base64
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from pdf_render import html_to_pdf
 
 def admin_required(f):
     @wraps(f)
@@ -30,9 +46,14 @@ def admin_required(f):
 # Backup Management
 # -------------------------------
 
+# PDF pool workers are spawned; under `python app.py` each one re-imports this module as
+# __mp_main__ and must not start a scheduler or touch the filesystem
+IN_PDF_WORKER = __name__ == '__mp_main__'
+
 # Initialize scheduler
 scheduler = BackgroundScheduler()
-scheduler.start()
+if not IN_PDF_WORKER:
+    scheduler.start()
 
 def create_backup():
     try:
@@ -110,8 +131,10 @@ def schedule_backups():
                 replace_existing=True
             )
     else:
-        # Remove any existing backup jobs
-        scheduler.remove_all_jobs()
+        # Remove any existing backup jobs (other scheduled jobs keep running)
+        for job_id in ('daily_backup', 'weekly_backup'):
+            if scheduler.get_job(job_id):
+                scheduler.remove_job(job_id)
 
 # -------------------------------
 # Flask App Config
@@ -132,7 +155,8 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Create upload directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+if not IN_PDF_WORKER:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -146,22 +170,69 @@ def resize_image(image_path, max_size=(200, 200)):
     except Exception as e:
         print(f"Error resizing image: {e}")
 
+# Attendance PDF rendering
+PDF_CACHE_DIR = os.path.join(app.root_path, 'pdf_cache')
+PDF_WORKERS = 2          # Render processes; keeps bulk printing from starving web requests
+PDF_WAIT_SECONDS = 10    # How long a request waits for a render before asking the browser to retry
+
+# Bulk student import
+IMPORT_FOLDER = os.path.join(app.root_path, 'imports')   # Uploaded files are kept here until fully imported
+IMPORT_EXTENSIONS = {'csv', 'xlsx'}
+IMPORT_BATCH_SIZE = 500   # Rows per transaction; progress is committed with each batch
+IMPORT_STALE_SECONDS = 10 * 60   # An 'importing' job with no committed batch for this long was abandoned
+
+# Conditional GET response cache (per process)
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024   # Total size of cached bodies
+RESPONSE_CACHE_MAX_ENTRY = 4 * 1024 * 1024    # Larger bodies are served but not kept
+
+# Static files linked through versioned_static() carry their mtime, so browsers may keep them this long
+STATIC_VERSIONED_MAX_AGE = 365 * 24 * 60 * 60
+
 db = SQLAlchemy(app)
 
+# -------------------------------
+# Family Model (Table)
+# -------------------------------
+class Family(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    number = db.Column(db.String(50), unique=True, nullable=False)  # The family number families are known by
+    parent = db.Column(db.String(100))   # Shared parent/guardian for the family
+    contact = db.Column(db.String(50))   # Shared contact for the family
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
 # -------------------------------
 # Student Model (Table)
 # -------------------------------
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    dob = db.Column(db.String(20), nullable=False)
+    dob = db.Column(db.Date, nullable=True)  # NULL only for legacy values the dob migration could not parse
     parent = db.Column(db.String(100))
     contact = db.Column(db.String(50))
     student_class = db.Column(db.String(50))
     status = db.Column(db.String(10), default="active")
     deletion_requested = db.Column(db.Boolean, default=False)
     profile_image = db.Column(db.String(200))  # Store image filename
-    family_id = db.Column(db.String(50))  # For grouping family members
+    family_id = db.Column(db.Integer, db.ForeignKey('family.id'), index=True)  # For grouping family members
+
+    family = db.relationship('Family', backref=db.backref('students', lazy=True), lazy='selectin')
+
+    @property
+    def family_number(self):
+        return self.family.number if self.family else None
+
+# Indexes behind the all-students orderings (active roster by name / dob)
+db.Index('ix_student_status_name', Student.status, func.lower(Student.name))
+db.Index('ix_student_status_dob', Student.status, Student.dob)
+
+# Indexes behind the active-roster filters by class and by family
+db.Index('ix_student_status_class', Student.status, Student.student_class)
+db.Index('ix_student_status_family', Student.status, Student.family_id)
+
+# Birthday as 'MM-DD'. The format is a literal rather than a bound parameter so
+# queries using this expression match the index below.
+student_birthday = func.strftime(literal_column("'%m-%d'"), Student.dob)
+db.Index('ix_student_status_birthday', Student.status, student_birthday)
 
          #Attebndance Model
 class Attendance(db.Model):
@@ -170,9 +241,118 @@ class Attendance(db.Model):
     date = db.Column(db.Date, nullable=False)
     present = db.Column(db.Boolean, default=True)
 
+    # One mark per student per Sunday; the date index serves month/range reports
+    __table_args__ = (
+        db.Index('uq_attendance_student_date', 'student_id', 'date', unique=True),
+        db.Index('ix_attendance_date', 'date'),
+    )
+
     # Relationship (optional but powerful)
     student = db.relationship('Student', backref=db.backref('attendances', lazy=True))
 
+# -------------------------------
+# Attendance Rollup (one row per student)
+# -------------------------------
+class AttendanceStats(db.Model):
+    # Only Sunday marks are counted, so present_count and sundays_tracked measure the same thing
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    present_count = db.Column(db.Integer, nullable=False, default=0)   # Sundays marked present
+    marked_count = db.Column(db.Integer, nullable=False, default=0)    # Sundays marked either way
+    first_marked = db.Column(db.Date, nullable=True)
+    last_present = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    student = db.relationship('Student', backref=db.backref('attendance_stats', uselist=False, lazy=True))
+
+    @property
+    def sundays_tracked(self):
+        """Sundays from the first recorded mark up to the most recent Sunday, or up to the
+        last one marked present when that is later in the month (so no rate exceeds 100%)
+        """
+        if not self.first_marked:
+            return 0
+        last = max(latest_sunday(), self.last_present or self.first_marked)
+        return max((last - self.first_marked).days // 7 + 1, 0)
+
+    @property
+    def attendance_rate(self):
+        """Percentage of tracked Sundays attended, or None before any marks exist"""
+        if not self.sundays_tracked:
+            return None
+        return round(100 * self.present_count / self.sundays_tracked)
+
+    @property
+    def absence_streak(self):
+        """Consecutive Sundays missed up to the most recent Sunday"""
+        since = self.last_present or (self.first_marked and self.first_marked - timedelta(weeks=1))
+        if not since:
+            return 0
+        return max((latest_sunday() - since).days // 7, 0)
+
+# -------------------------------
+# Compact Attendance History (one bitmask per student per year)
+# -------------------------------
+class AttendanceBits(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    present_mask = db.Column(db.Integer, nullable=False, default=0)  # bit i = i-th Sunday of the year
+
+# -------------------------------
+# Attendance Month Versions (bumped on every attendance write for that month)
+# -------------------------------
+class AttendanceMonthVersion(db.Model):
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# -------------------------------
+# Data Versions (per-table change counters, bumped by triggers on every write)
+# -------------------------------
+class DataVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # Table name
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())  # UTC
+
+# -------------------------------
+# Scheduled Job State (high-water marks for incremental jobs)
+# -------------------------------
+class JobState(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    high_water = db.Column(db.Date, nullable=True)     # Last day the job has fully processed
+    last_changed = db.Column(db.Integer, default=0)    # Rows changed by the most recent run
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+# -------------------------------
+# Student Import Model (one row per uploaded file)
+# -------------------------------
+class StudentImport(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    file_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the upload
+    filename = db.Column(db.String(200))
+    file_type = db.Column(db.String(10), nullable=False)  # csv or xlsx
+    status = db.Column(db.String(20), nullable=False, default='running')  # running (resumable), importing, done, failed
+    rows_done = db.Column(db.Integer, nullable=False, default=0)  # Last file row committed (header is row 1)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)  # JSON list of {row, name, error}
+    created_by = db.Column(db.String(100))
+    started_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    @property
+    def file_path(self):
+        return os.path.join(IMPORT_FOLDER, f"{self.file_hash}.{self.file_type}")
+
+    @property
+    def error_list(self):
+        return json.loads(self.errors or '[]')
+
+    @property
+    def resumable(self):
+        if self.status == 'importing':
+            return self.updated_at < datetime.now() - timedelta(seconds=IMPORT_STALE_SECONDS)
+        return self.status == 'running'
+
 # -------------------------------
 # Inventory Model (Table)
 # -------------------------------
@@ -263,6 +443,233 @@ def create_default_users():
 
         db.session.commit()
 
+# -------------------------------
+# Database Migrations
+# -------------------------------
+def migrate_attendance_keys():
+    """Remove duplicate attendance marks and add the (student_id, date) unique key to an existing database"""
+    # Keep the most recent mark for each student/date pair
+    removed = db.session.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN ("
+        "SELECT MAX(id) FROM attendance GROUP BY student_id, date)"
+    )).rowcount
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_student_date ON attendance (student_id, date)"
+    ))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_attendance_date ON attendance (date)"))
+    db.session.commit()
+    if removed:
+        print(f"Removed {removed} duplicate attendance records")
+
+def migrate_families():
+    """Create a Family for every distinct free-text family number still stored on students.
+
+    Each family takes its parent and contact from its earliest-registered student that has one.
+    """
+    added = db.session.execute(text(
+        "INSERT OR IGNORE INTO family (number, parent, contact, created_at) "
+        "SELECT trim(s.family_id), "
+        "(SELECT p.parent FROM student p WHERE trim(p.family_id) = trim(s.family_id) "
+        " AND coalesce(p.parent, '') != '' ORDER BY p.id LIMIT 1), "
+        "(SELECT c.contact FROM student c WHERE trim(c.family_id) = trim(s.family_id) "
+        " AND coalesce(c.contact, '') != '' ORDER BY c.id LIMIT 1), "
+        "CURRENT_TIMESTAMP "
+        "FROM student s WHERE trim(coalesce(s.family_id, '')) != '' GROUP BY trim(s.family_id)"
+    )).rowcount
+    print(f"Created {added} families from student family numbers")
+
+def migrate_student_table():
+    """Rebuild the student table when its columns predate the current model.
+
+    - dob becomes a typed, validated DATE. Values in other common formats are normalised;
+      values that cannot be parsed are reported and stored as NULL so they can be corrected
+      from the edit form.
+    - family_id becomes an indexed foreign key to family, replacing the free-text number.
+    """
+    columns = {row[1]: row[2].upper() for row in db.session.execute(text("PRAGMA table_info(student)"))}
+    convert_dob = columns.get('dob') != 'DATE'
+    convert_family = columns.get('family_id') != 'INTEGER'
+    if not (convert_dob or convert_family):
+        return
+
+    converted, failed = [], []
+    if convert_dob:
+        for student_id, name, raw in db.session.execute(text("SELECT id, name, dob FROM student")):
+            dob = parse_dob(raw)
+            if dob is None:
+                failed.append((student_id, name, raw))
+            if dob is None or dob.isoformat() != raw:
+                converted.append({'id': student_id, 'dob': dob.isoformat() if dob else None})
+    if convert_family:
+        migrate_families()
+
+    # SQLite cannot change a column type in place: create, copy, drop, rename.
+    # Dropping the old table drops its indexes and search triggers; the later
+    # migrations recreate them against the new table.
+    create_sql = str(CreateTable(Student.__table__).compile(db.engine))
+    db.session.execute(text(create_sql.replace("CREATE TABLE student ", "CREATE TABLE student_new ", 1)))
+    copied = [column.name for column in Student.__table__.columns if column.name in columns]
+    selected = [
+        "(SELECT f.id FROM family f WHERE f.number = trim(student.family_id))"
+        if name == 'family_id' and convert_family else name
+        for name in copied
+    ]
+    db.session.execute(text(
+        f"INSERT INTO student_new ({', '.join(copied)}) SELECT {', '.join(selected)} FROM student"
+    ))
+    if converted:
+        db.session.execute(text("UPDATE student_new SET dob = :dob WHERE id = :id"), converted)
+    db.session.execute(text("DROP TABLE student"))
+    db.session.execute(text("ALTER TABLE student_new RENAME TO student"))
+    db.session.commit()
+
+    if convert_dob:
+        print(f"Converted student dates of birth ({len(converted) - len(failed)} reformatted)")
+    if failed:
+        print(f"{len(failed)} dates of birth could not be parsed and were cleared; please re-enter them:")
+        for student_id, name, raw in failed:
+            print(f"  student {student_id} ({name}): {raw!r}")
+
+def migrate_attendance_stats():
+    """Fill the attendance rollup the first time it is created on a database that already has marks"""
+    if AttendanceStats.query.first() is None and Attendance.query.first() is not None:
+        refresh_attendance_stats()
+        db.session.commit()
+        print("Built attendance rollup from existing attendance records")
+
+def migrate_attendance_bits():
+    """Fill the attendance bitsets the first time they are created on a database that already has marks"""
+    if AttendanceBits.query.first() is None and Attendance.query.first() is not None:
+        rebuild_attendance_bits()
+        db.session.commit()
+        print("Built attendance bitsets from existing attendance records")
+
+# The search index keeps its own copy of each student's name, parent and family number
+STUDENT_FTS_FAMILY = "(SELECT number FROM family WHERE id = new.family_id)"
+STUDENT_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS student_fts USING fts5("
+    "name, parent, family, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_ai AFTER INSERT ON student BEGIN "
+    f"INSERT INTO student_fts(rowid, name, parent, family) VALUES (new.id, new.name, new.parent, {STUDENT_FTS_FAMILY}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_ad AFTER DELETE ON student BEGIN "
+    "DELETE FROM student_fts WHERE rowid = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_au AFTER UPDATE OF name, parent, family_id ON student BEGIN "
+    f"UPDATE student_fts SET name = new.name, parent = new.parent, family = {STUDENT_FTS_FAMILY} "
+    "WHERE rowid = new.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_family_au AFTER UPDATE OF number ON family BEGIN "
+    "UPDATE student_fts SET family = new.number WHERE rowid IN (SELECT id FROM student WHERE family_id = new.id); "
+    "END",
+]
+
+def migrate_student_search():
+    """Create the FTS5 search index over students (kept in sync by triggers) and fill it on first run"""
+    existing = db.session.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'student_fts'"
+    )).scalar()
+    if existing and "content='student'" in existing:
+        # Earlier index read family numbers straight from the student table; replace it
+        for trigger in ('student_fts_ai', 'student_fts_ad', 'student_fts_au'):
+            db.session.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        db.session.execute(text("DROP TABLE student_fts"))
+        existing = None
+    for statement in STUDENT_FTS_SCHEMA:
+        db.session.execute(text(statement))
+    if existing is None:
+        db.session.execute(text(
+            "INSERT INTO student_fts(rowid, name, parent, family) "
+            "SELECT s.id, s.name, s.parent, f.number FROM student s LEFT JOIN family f ON f.id = s.family_id"
+        ))
+        print("Built student search index")
+    db.session.commit()
+
+def missing_indexes():
+    """Indexes declared on the models that the database does not have, in table order"""
+    # Look names up directly: reflection skips expression indexes such as lower(name)
+    existing = {row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    return [index for table in db.metadata.sorted_tables
+            for index in sorted(table.indexes, key=lambda index: index.name)
+            if index.name not in existing]
+
+def migrate_indexes():
+    """Create any index declared on the models that an existing database is missing"""
+    created = missing_indexes()
+    for index in created:
+        index.create(db.engine)
+    if created:
+        print(f"Created indexes: {', '.join(index.name for index in created)}")
+
+_index_check_done = False
+
+def warn_missing_indexes():
+    """Print a warning naming any expected index the database lacks (checked once per process)"""
+    global _index_check_done
+    _index_check_done = True
+    missing = missing_indexes()
+    if missing:
+        print(f"WARNING: database is missing indexes {', '.join(index.name for index in missing)}; "
+              "queries will scan whole tables. Run `flask migrate-db` to create them.")
+    return missing
+
+@app.before_request
+def check_indexes_on_startup():
+    # Workers started by gunicorn never run the migrations, so check on their first request
+    if not _index_check_done:
+        warn_missing_indexes()
+
+DATA_VERSION_TABLES = ['student', 'family', 'attendance']
+
+def migrate_data_versions():
+    """Create the change counter for each tracked table and the triggers that bump it.
+
+    Triggers catch every write (ORM, bulk executemany, raw SQL, other worker processes),
+    and the bump commits or rolls back with the write itself.
+    """
+    for table in DATA_VERSION_TABLES:
+        db.session.execute(text(
+            "INSERT OR IGNORE INTO data_version (name, version, changed_at) VALUES (:name, 0, CURRENT_TIMESTAMP)"
+        ), {'name': table})
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            db.session.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS data_version_{table}_{event.lower()} AFTER {event} ON {table} BEGIN "
+                f"UPDATE data_version SET version = version + 1, changed_at = CURRENT_TIMESTAMP WHERE name = '{table}'; "
+                "END"
+            ))
+    db.session.commit()
+
+def run_migrations():
+    """Bring an existing church_register.db up to date with the current models"""
+    db.create_all()
+    migrate_attendance_keys()
+    migrate_student_table()
+    migrate_indexes()
+    migrate_student_search()
+    migrate_data_versions()
+    migrate_attendance_stats()
+    migrate_attendance_bits()
+
+@app.cli.command("migrate-db")
+def migrate_db_command():
+    """Apply database migrations (safe to run more than once)."""
+    run_migrations()
+    print("Database is up to date.")
+
+@app.cli.command("reassign-classes")
+def reassign_classes_command():
+    """Move students whose birthdays since the last run changed their age band."""
+    moved = reassign_classes_by_birthday()
+    print(f"Moved {moved} students to new classes.")
+
+@app.cli.command("rebuild-attendance-stats")
+def rebuild_attendance_stats_command():
+    """Recompute the per-student attendance rollup and bitsets from scratch."""
+    refresh_attendance_stats()
+    rebuild_attendance_bits()
+    db.session.commit()
+    print(f"Rebuilt attendance stats for {AttendanceStats.query.count()} students.")
+
 # -------------------------------
 # Helper: Get all Sundays in a month
 # -------------------------------
@@ -274,17 +681,1288 @@ def get_sundays(year, month):
             sundays.append(day)
     return sundays
 
+def get_current_sunday(sundays, today=None):
+    """Today if it is a Sunday, else the latest of `sundays` already past, else today"""
+    today = today or date.today()
+    if today.weekday() == 6:
+        return today
+    past = [sunday for sunday in sundays if sunday <= today]
+    return past[-1] if past else today
+
+# -------------------------------
+# Helper: Dates of birth, ages and class bands
+# -------------------------------
+# Age bands, youngest first: (oldest age in the band, class). The last band takes everyone older.
+AGE_BANDS = [
+    (5, "Genesis"),
+    (7, "Exodus"),
+    (9, "Psalms"),
+    (11, "Proverbs"),
+    (13, "Revelation"),
+    (None, "High Schoolers"),
+]
+CLASS_NAMES = [name for _, name in AGE_BANDS]
+AGE_BAND_LIMITS = np.array([limit for limit, _ in AGE_BANDS[:-1]])
+
+# Formats accepted for dates of birth; day-first wins over month-first for ambiguous slashes
+DOB_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+               "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"]
+
+def parse_date_value(value):
+    """Return a date from a date/datetime (e.g. a spreadsheet cell) or a string in one of DOB_FORMATS, else None"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value or '').strip()
+    for fmt in DOB_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def parse_dob(value, today=None):
+    """Return a date of birth as a date, or None if it cannot be parsed or is not a plausible birth date"""
+    value = parse_date_value(value)
+    if value is None or not date(1900, 1, 1) <= value <= (today or date.today()):
+        return None
+    return value
+
+def calculate_age(dob, today=None):
+    """Age in whole years on `today`, or None when the date of birth is unknown"""
+    if dob is None:
+        return None
+    today = today or date.today()
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+def student_birth_and_class(dob, age=None, today=None):
+    """Return (date of birth, class) from a date of birth or, failing that, an age.
+
+    A given date of birth takes precedence; an age alone gives an approximate birth date.
+    Raises ValueError with a message suitable for showing to the user.
+    """
+    today = today or date.today()
+    if dob not in (None, ''):
+        birth = parse_date_value(dob)
+        if birth is None:
+            raise ValueError("Invalid date of birth format. Use YYYY-MM-DD.")
+        if birth > today:
+            raise ValueError("Date of birth cannot be in the future!")
+        return birth, class_for_age(calculate_age(birth, today))
+
+    if age not in (None, ''):
+        try:
+            age = float(age)
+            if not age.is_integer() or age < 0 or age > 120:
+                raise ValueError
+            age = int(age)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid age provided.")
+        # Approximate birth date: today's date minus age years
+        try:
+            birth = today.replace(year=today.year - age)
+        except ValueError:
+            # Fallback if replace fails (e.g., Feb 29)
+            birth = today - timedelta(days=age * 365)
+        return birth, class_for_age(age)
+
+    raise ValueError("Please provide either a date of birth or an age.")
+
+def class_for_age(age):
+    """Class for a single age, from AGE_BANDS"""
+    return CLASS_NAMES[int(np.searchsorted(AGE_BAND_LIMITS, age, side='left'))]
+
+def ages_on(dobs, today=None):
+    """Vectorised calculate_age: whole-year ages for a sequence of dates of birth"""
+    today = today or date.today()
+    dobs = np.asarray(dobs, dtype='datetime64[D]')
+    months = dobs.astype('datetime64[M]')
+    years = dobs.astype('datetime64[Y]').astype(int) + 1970
+    month_day = (months.astype(int) % 12 + 1) * 100 + (dobs - months).astype(int) + 1
+    return today.year - years - (month_day > today.month * 100 + today.day)
+
+def classes_for_ages(ages):
+    """Vectorised class_for_age"""
+    return np.array(CLASS_NAMES, dtype=object)[np.searchsorted(AGE_BAND_LIMITS, ages, side='left')]
+
+def student_age_sql(today=None):
+    """SQL expression for a student's age in whole years on `today`"""
+    today = today or date.today()
+    return (today.year - cast(func.strftime('%Y', Student.dob), Integer)
+            - case((func.strftime('%m-%d', Student.dob) > today.strftime('%m-%d'), 1), else_=0))
+
+def age_class_sql(today=None):
+    """SQL expression for the class a student's age places them in (NULL when dob is unknown)"""
+    age = student_age_sql(today)
+    return case(
+        (Student.dob.is_(None), None),
+        *[(age <= limit, name) for limit, name in AGE_BANDS[:-1]],
+        else_=AGE_BANDS[-1][1]
+    )
+
+def birthday_in_month_sql(month):
+    """SQL filter for students whose birthday falls in `month` (served by ix_student_status_birthday)"""
+    return student_birthday.between(f"{month:02d}-01", f"{month:02d}-31")
+
+# -------------------------------
+# Helper: Class promotion engine
+# -------------------------------
+def plan_promotions(today=None, criteria=()):
+    """Age and target class for every active student (optionally narrowed by the SQL filters in `criteria`),
+    as a list of dicts ready for preview.
+
+    Loads plain rows rather than Student objects and assigns classes for the whole roster at once.
+    """
+    rows = with_families(db.session.query(
+        Student.id, Student.name, Family.number.label('family_number'), Student.dob, Student.student_class
+    )).filter(Student.status == 'active', *criteria).order_by(Student.name).all()
+
+    known = [i for i, row in enumerate(rows) if row.dob is not None]
+    ages = ages_on([rows[i].dob for i in known], today)
+    targets = classes_for_ages(ages)
+    assigned = {i: (int(age), target) for i, age, target in zip(known, ages, targets)}
+
+    plan = []
+    for i, row in enumerate(rows):
+        age, target = assigned.get(i, (None, None))
+        plan.append({
+            'student': row,
+            'age': age,
+            'current_class': row.student_class,
+            'suggested_class': target,
+            'needs_promotion': target is not None and row.student_class != target
+        })
+    return plan
+
+def apply_promotions(plan):
+    """Move every student the plan flags to their suggested class with one
+    UPDATE ... SET student_class = CASE id ... END per batch of ids.
+
+    Runs inside the caller's transaction; the caller commits. Returns the number of students moved.
+    """
+    moves = {item['student'].id: item['suggested_class'] for item in plan if item['needs_promotion']}
+    ids = sorted(moves)
+    moved = 0
+    for start in range(0, len(ids), STUDENT_UPDATE_BATCH):
+        batch = ids[start:start + STUDENT_UPDATE_BATCH]
+        moved += db.session.execute(
+            Student.__table__.update()
+            .where(Student.id.in_(batch))
+            .values(student_class=case({i: moves[i] for i in batch}, value=Student.id))
+        ).rowcount
+    return moved
+
+# -------------------------------
+# Helper: Bulk student changes
+# -------------------------------
+STUDENT_UPDATE_BATCH = 500   # Ids per UPDATE ... WHERE id IN (...) statement
+
+def parse_student_ids(values):
+    """Distinct integer ids from submitted form values, ignoring anything that is not a number"""
+    return sorted({int(value) for value in values if str(value).strip().isdigit()})
+
+def update_students(student_ids, *criteria, **values):
+    """Set `values` on the listed students with one UPDATE per batch of ids.
+
+    Only rows that also match `criteria` are changed. Runs inside the caller's
+    transaction; the caller commits. Returns the number of students changed.
+    """
+    ids = parse_student_ids(student_ids)
+    changed = 0
+    for start in range(0, len(ids), STUDENT_UPDATE_BATCH):
+        changed += db.session.execute(
+            Student.__table__.update()
+            .where(Student.id.in_(ids[start:start + STUDENT_UPDATE_BATCH]), *criteria)
+            .values(**values)
+        ).rowcount
+    return changed
+
+def set_student_status(student_ids, status):
+    """Move students to `status` (deleted students stay deleted). Returns how many changed."""
+    return update_students(student_ids, Student.status != 'deleted', Student.status != status, status=status)
+
+def set_student_class(student_ids, student_class):
+    """Move students to `student_class`. Returns how many changed."""
+    return update_students(student_ids, Student.student_class.isnot(student_class), student_class=student_class)
+
+# -------------------------------
+# Scheduled Job: Birthday class reassignment
+# -------------------------------
+BIRTHDAY_JOB = 'birthday_reassignment'
+
+def birthdays_since_sql(since, today):
+    """SQL filter for birthdays after `since` up to and including `today` (less than a year apart).
+
+    The lower bound is exclusive so a 29 February birthday is picked up on 1 March in other years.
+    """
+    since_key, today_key = since.strftime('%m-%d'), today.strftime('%m-%d')
+    if since_key < today_key:
+        return and_(student_birthday > since_key, student_birthday <= today_key)
+    return or_(student_birthday > since_key, student_birthday <= today_key)
+
+def claim_job_window(name, since, today):
+    """Move a job's high-water mark from `since` to `today`; False if another process moved it first.
+
+    The compare-and-swap takes SQLite's write lock before the job reads anything, so when
+    several workers run the same job only one of them does the work. Runs inside the
+    caller's transaction, which holds the claim until it commits.
+    """
+    if since is None:
+        claim = (sqlite_insert(JobState).values(name=name, high_water=today, last_changed=0)
+                 .on_conflict_do_update(index_elements=['name'], set_={'high_water': today},
+                                        where=JobState.high_water.is_(None)))
+    else:
+        claim = (JobState.__table__.update()
+                 .where(JobState.name == name, JobState.high_water == since)
+                 .values(high_water=today))
+    return db.session.execute(claim).rowcount == 1
+
+def reassign_classes_by_birthday(today=None):
+    """Move students whose birthdays since the last run took them into a new age band.
+
+    Only students with a birthday in that window whose age band on the last run differs
+    from their band today are loaded, so a birthday within a band never undoes a manual
+    placement. The first run just records the high-water mark; a gap of a year or more
+    checks the whole roster.
+    Returns the number of students moved.
+    """
+    today = today or date.today()
+    state = db.session.get(JobState, BIRTHDAY_JOB)
+    since = state.high_water if state else None
+    if since is not None and since >= today:
+        return 0
+    if not claim_job_window(BIRTHDAY_JOB, since, today):
+        # Another process (a second gunicorn worker) already ran it
+        db.session.rollback()
+        return 0
+
+    moved = 0
+    if since is not None:
+        criteria = [age_class_sql(since) != age_class_sql(today)]
+        if (today - since).days < 365:
+            criteria.append(birthdays_since_sql(since, today))
+        plan = plan_promotions(today, criteria=criteria)
+        moved = apply_promotions(plan)
+        for item in plan:
+            if item['needs_promotion']:
+                print(f"Birthday move: {item['student'].name} from {item['current_class']} "
+                      f"to {item['suggested_class']} (Age: {item['age']})")
+
+    db.session.execute(JobState.__table__.update().where(JobState.name == BIRTHDAY_JOB).values(last_changed=moved))
+    db.session.commit()
+    return moved
+
+def run_birthday_reassignment():
+    """Scheduler entry point"""
+    with app.app_context():
+        try:
+            reassign_classes_by_birthday()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Birthday class reassignment failed: {str(e)}")
+
+def schedule_class_reassignment():
+    """Register the birthday job in this process.
+
+    Every gunicorn worker registers it on its first request; claim_job_window()
+    makes sure only one of them moves anyone each day.
+    """
+    global _class_reassignment_scheduled
+    _class_reassignment_scheduled = True
+    # Daily just after midnight, plus once now to catch up on days the app was not running
+    scheduler.add_job(
+        run_birthday_reassignment,
+        'cron',
+        hour=0,
+        minute=5,
+        id=BIRTHDAY_JOB,
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
+
+_class_reassignment_scheduled = False
+
+@app.before_request
+def schedule_class_reassignment_on_startup():
+    # gunicorn never runs __main__, so each worker registers the job on its first request
+    if not _class_reassignment_scheduled and not app.testing:
+        schedule_class_reassignment()
+
+# -------------------------------
+# Helper: Bulk student import
+# -------------------------------
+# Accepted column headings (lower case, underscores as spaces) and the field each one fills
+IMPORT_COLUMNS = {
+    'name': 'name', 'student name': 'name', 'full name': 'name',
+    'dob': 'dob', 'date of birth': 'dob', 'birth date': 'dob', 'birthday': 'dob',
+    'age': 'age',
+    'parent': 'parent', 'parent name': 'parent', 'guardian': 'parent',
+    'contact': 'contact', 'phone': 'contact', 'parent contact': 'contact',
+    'family id': 'family_id', 'family': 'family_id', 'family number': 'family_id',
+}
+
+def import_text(value):
+    """Cell value as trimmed text; whole-number floats from spreadsheets lose their '.0'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+class ImportHeaderError(ValueError):
+    """The upload's header row cannot be used, so none of the file can be imported"""
+
+def map_import_rows(rows):
+    """Yield (row number, {field: value}) for the non-blank rows after the header row"""
+    header = next(rows, None) or []
+    fields = [IMPORT_COLUMNS.get(import_text(cell).lower().replace('_', ' ')) for cell in header]
+    if 'name' not in fields:
+        raise ImportHeaderError("The file needs a Name column.")
+    for row_number, row in enumerate(rows, 2):
+        values = {field: value for field, value in zip(fields, row) if field and value not in (None, '')}
+        if values:
+            yield row_number, values
+
+def iter_import_rows(path, file_type):
+    """Stream the rows of a CSV or XLSX upload (openpyxl read-only mode) without loading the file whole"""
+    if file_type == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from map_import_rows(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from map_import_rows(csv.reader(f))
+
+def import_student_record(values, today=None):
+    """Validate one import row and return the student row to insert, applying the add_student rules"""
+    name = import_text(values.get('name'))
+    if not name:
+        raise ValueError("Name is required.")
+    if len(name) > 100:
+        raise ValueError("Name is longer than 100 characters.")
+    dob = values.get('dob')
+    birth, student_class = student_birth_and_class(
+        dob if isinstance(dob, date) else import_text(dob), import_text(values.get('age')), today)
+    return {
+        'name': name,
+        'dob': birth,
+        'parent': import_text(values.get('parent'))[:100],
+        'contact': import_text(values.get('contact'))[:50],
+        'student_class': student_class,
+        'family_number': import_text(values.get('family_id'))[:50],
+    }
+
+def run_student_import(job):
+    """Import the rows of `job`'s file that come after `job.rows_done`, in batched transactions.
+
+    Each batch of inserts is committed together with the job's progress and error report,
+    so an interrupted import resumes at the first uncommitted row. A file that stops decoding
+    part-way marks the job 'failed' after committing the rows before that point.
+    """
+    today = date.today()
+    errors = job.error_list
+    batch, pending, last_row = [], 0, job.rows_done
+
+    def commit_batch():
+        if batch:
+            resolve_family_ids(batch)
+            db.session.execute(Student.__table__.insert(), batch)
+        job.rows_done = last_row
+        job.inserted += len(batch)
+        job.failed = len(errors)
+        job.errors = json.dumps(errors)
+        db.session.commit()
+        batch.clear()
+
+    try:
+        for row_number, values in iter_import_rows(job.file_path, job.file_type):
+            if row_number <= job.rows_done:
+                continue
+            try:
+                batch.append(import_student_record(values, today))
+            except ValueError as e:
+                errors.append({'row': row_number, 'name': import_text(values.get('name')), 'error': str(e)})
+            last_row = row_number
+            pending += 1
+            if pending >= IMPORT_BATCH_SIZE:
+                commit_batch()
+                pending = 0
+    except UnicodeDecodeError:
+        # The rows read so far stand; the rest of the file cannot be read as text. A re-saved
+        # file is a new upload that starts again at row 2, so say exactly which rows to drop.
+        commit_batch()
+        job.status = 'failed'
+        if last_row < 2:
+            error = "The file is not UTF-8 text; save it as CSV UTF-8 and import it again."
+        else:
+            error = (f"The file is not UTF-8 text after row {last_row}. Rows 2 to {last_row} were processed "
+                     "(see the errors above); save the file as CSV UTF-8, delete those rows and import it again.")
+        errors.append({'row': last_row + 1, 'name': '', 'error': error})
+
+    commit_batch()
+
+def claim_student_import(job, statuses):
+    """Mark `job` 'importing' if it is in one of `statuses` or was abandoned mid-import.
+
+    The check and the update are one statement, so when two requests upload the same file
+    only one of them runs the import. Returns whether this request got the job.
+    """
+    now = datetime.now()
+    claimed = db.session.execute(
+        StudentImport.__table__.update()
+        .where(StudentImport.id == job.id,
+               or_(StudentImport.status.in_(statuses),
+                   and_(StudentImport.status == 'importing',
+                        StudentImport.updated_at < now - timedelta(seconds=IMPORT_STALE_SECONDS))))
+        .values(status='importing', updated_at=now)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+def save_import_upload(file, file_type):
+    """Save an upload into IMPORT_FOLDER under its sha256, returning the hash"""
+    os.makedirs(IMPORT_FOLDER, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=IMPORT_FOLDER, suffix='.part')
+    with os.fdopen(fd, 'wb') as out:
+        for chunk in iter(partial(file.stream.read, 64 * 1024), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    file_hash = digest.hexdigest()
+    os.replace(temp_path, os.path.join(IMPORT_FOLDER, f"{file_hash}.{file_type}"))
+    return file_hash
+
+# -------------------------------
+# Helper: Prefetch attendance for a roster
+# -------------------------------
+def get_attendance_lookup(roster_query, sundays):
+    """Return the set of (student_id, date) pairs marked present, loaded in one query"""
+    if not sundays:
+        return set()
+    student_ids = roster_query.with_entities(Student.id).scalar_subquery()
+    rows = db.session.query(Attendance.student_id, Attendance.date).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.date.in_(sundays),
+        Attendance.present == True
+    ).all()
+    return {(student_id, day) for student_id, day in rows}
+
+def load_month_attendance_masks(student_ids, sundays):
+    """{student_id: mask} for one month's `sundays`; bit i is set when present on sundays[i].
+
+    Read from the attendance table, like get_attendance_lookup, so a roster page shows the same
+    marks as the full render even where attendance_bits was never backfilled.
+    """
+    if not sundays or not student_ids:
+        return {}
+    bits = {sunday: 1 << i for i, sunday in enumerate(sundays)}
+    rows = db.session.query(Attendance.student_id, Attendance.date).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.date.in_(sundays),
+        Attendance.present == True
+    )
+    masks = {}
+    for student_id, day in rows:
+        masks[student_id] = masks.get(student_id, 0) | bits[day]
+    return masks
+
+def count_present_on(roster_query, day):
+    """How many students on a roster (excluding those pending deletion) are marked present on `day`"""
+    student_ids = roster_query.filter(Student.deletion_requested.isnot(True)).with_entities(Student.id).scalar_subquery()
+    return db.session.query(func.count(Attendance.id)).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.date == day,
+        Attendance.present == True
+    ).scalar()
+
+# -------------------------------
+# Helper: Missed-Sunday / at-risk engine
+# -------------------------------
+AT_RISK_WINDOW = 4           # How many recent Sundays are checked
+AT_RISK_THRESHOLD = 3        # Missed Sundays before a student is flagged
+DEACTIVATION_THRESHOLD = 4   # Missed Sundays before a student is deactivated
+
+def latest_sunday(today=None):
+    """Return today if it is a Sunday, otherwise the most recent Sunday"""
+    today = today or date.today()
+    return today - timedelta(days=(today.weekday() + 1) % 7)
+
+def get_recent_sundays(count=AT_RISK_WINDOW, today=None):
+    """Return the last `count` Sundays before today, most recent first"""
+    today = today or date.today()
+    last_sunday = today - timedelta(days=(today.weekday() + 1) % 7 or 7)
+    return [last_sunday - timedelta(weeks=i) for i in range(count)]
+
+def missed_sundays_query(sundays, threshold):
+    """Query of (Student, missed_count) for active students who missed at least `threshold` of `sundays`.
+
+    Reads the window's marks through the (student_id, date) key rather than a rollup: "3 of the
+    last 4" needs per-Sunday marks, which AttendanceStats does not keep, and both rollups are only
+    backfilled by migrate-db - an empty one would flag (and deactivate) the whole roster.
+    """
+    missed_count = (len(sundays) - func.count(Attendance.id)).label('missed_count')
+    return db.session.query(Student, missed_count).outerjoin(
+        Attendance,
+        and_(Attendance.student_id == Student.id,
+             Attendance.date.in_(sundays),
+             Attendance.present == True)
+    ).filter(Student.status == 'active').group_by(Student.id).having(missed_count >= threshold)
+
+def count_students_at_risk(window=AT_RISK_WINDOW, threshold=AT_RISK_THRESHOLD):
+    return missed_sundays_query(get_recent_sundays(window), threshold).count()
+
+def get_students_at_risk(window=AT_RISK_WINDOW, threshold=AT_RISK_THRESHOLD):
+    """Return (sundays, at_risk) where at_risk lists each flagged student with their per-Sunday attendance"""
+    sundays = get_recent_sundays(window)
+    flagged = missed_sundays_query(sundays, threshold).all()
+    if not flagged:
+        return sundays, []
+
+    present_marks = set(db.session.query(Attendance.student_id, Attendance.date).filter(
+        Attendance.student_id.in_([student.id for student, _ in flagged]),
+        Attendance.date.in_(sundays),
+        Attendance.present == True
+    ).all())
+
+    at_risk = []
+    for student, missed_count in flagged:
+        at_risk.append({
+            'student': student,
+            'missed_count': missed_count,
+            'attendance': [(sunday, (student.id, sunday) in present_marks) for sunday in sundays]
+        })
+    return sundays, at_risk
+
+# -------------------------------
+# Helper: Attendance rollup maintenance
+# -------------------------------
+# Sunday marks only; strftime('%w') is '0' on a Sunday
+attendance_on_sunday = func.strftime(literal_column("'%w'"), Attendance.date) == '0'
+
+def refresh_attendance_stats(student_ids=None):
+    """Recompute AttendanceStats rows for the given students (or everyone) from their attendance marks.
+
+    Used to build and repair the rollup; saved marks update it incrementally through
+    update_attendance_stats. Runs inside the caller's transaction; the caller commits.
+    """
+    stats_delete = AttendanceStats.__table__.delete()
+    rollup = select(
+        Attendance.student_id,
+        func.sum(case((Attendance.present == True, 1), else_=0)),
+        func.count(Attendance.id),
+        func.min(Attendance.date),
+        func.max(case((Attendance.present == True, Attendance.date))),
+        func.datetime('now', 'localtime')
+    ).where(attendance_on_sunday).group_by(Attendance.student_id)
+
+    if student_ids is not None:
+        student_ids = list(student_ids)
+        if not student_ids:
+            return
+        stats_delete = stats_delete.where(AttendanceStats.student_id.in_(student_ids))
+        rollup = rollup.where(Attendance.student_id.in_(student_ids))
+
+    db.session.execute(stats_delete)
+    db.session.execute(AttendanceStats.__table__.insert().from_select(
+        ['student_id', 'present_count', 'marked_count', 'first_marked', 'last_present', 'updated_at'],
+        rollup
+    ))
+
+# Applies one Sunday mark to its student's rollup row. It must run before the mark is written:
+# the subqueries read the mark being replaced, so only the change is added. A student with
+# no rollup row yet is counted from their other marks, which also repairs missing rows.
+ATTENDANCE_STATS_UPSERT = text(
+    "INSERT INTO attendance_stats (student_id, present_count, marked_count, first_marked, last_present, updated_at) "
+    "SELECT :student_id, coalesce(sum(present), 0) + :present, count(id) + 1, "
+    "CASE WHEN min(date) < :day THEN min(date) ELSE :day END, "
+    "CASE WHEN :present THEN CASE WHEN max(CASE WHEN present THEN date END) > :day "
+    "THEN max(CASE WHEN present THEN date END) ELSE :day END "
+    "ELSE max(CASE WHEN present THEN date END) END, "
+    "datetime('now', 'localtime') "
+    "FROM attendance WHERE student_id = :student_id AND date != :day AND strftime('%w', date) = '0' "
+    "ON CONFLICT (student_id) DO UPDATE SET "
+    "present_count = present_count + :present "
+    "- coalesce((SELECT present FROM attendance WHERE student_id = :student_id AND date = :day), 0), "
+    "marked_count = marked_count "
+    "+ NOT EXISTS (SELECT 1 FROM attendance WHERE student_id = :student_id AND date = :day), "
+    "first_marked = CASE WHEN first_marked IS NULL OR :day < first_marked THEN :day ELSE first_marked END, "
+    "last_present = CASE "
+    "WHEN :present AND (last_present IS NULL OR :day > last_present) THEN :day "
+    "WHEN NOT :present AND last_present = :day THEN (SELECT max(date) FROM attendance "
+    "WHERE student_id = :student_id AND present AND date != :day AND strftime('%w', date) = '0') "
+    "ELSE last_present END, "
+    "updated_at = datetime('now', 'localtime')"
+)
+
+def update_attendance_stats(marks):
+    """Apply {(student_id, date): present} Sunday marks to the rollup as deltas, before the marks
+    themselves are written. Runs inside the caller's transaction.
+    """
+    if marks:
+        db.session.execute(ATTENDANCE_STATS_UPSERT, [
+            {'student_id': student_id, 'day': day.isoformat(), 'present': int(present)}
+            for (student_id, day), present in marks.items()
+        ])
+
+def get_attendance_stats(student_ids_query):
+    """Return {student_id: AttendanceStats} for a roster in one query"""
+    student_ids = student_ids_query.with_entities(Student.id).scalar_subquery()
+    return {
+        stats.student_id: stats
+        for stats in AttendanceStats.query.filter(AttendanceStats.student_id.in_(student_ids))
+    }
+
+# -------------------------------
+# Helper: Attendance bitsets
+# -------------------------------
+@lru_cache(maxsize=64)
+def get_year_sundays(year):
+    """All Sundays in a year, in order; bit i of a year mask refers to the i-th one"""
+    return tuple(sunday for month in range(1, 13) for sunday in get_sundays(year, month))
+
+def sunday_bit(day):
+    """Return (year, bit index) for a Sunday, or None for any other day"""
+    if day.weekday() != 6:
+        return None
+    return day.year, (day - get_year_sundays(day.year)[0]).days // 7
+
+def update_attendance_bits(marks):
+    """Set or clear the bits for {(student_id, date): present} marks. Runs inside the caller's transaction."""
+    masks = {}
+    for (student_id, day), present in marks.items():
+        bit = sunday_bit(day)
+        if bit is None:
+            continue
+        year, index = bit
+        set_bits, clear_bits = masks.get((student_id, year), (0, 0))
+        if present:
+            masks[(student_id, year)] = (set_bits | 1 << index, clear_bits & ~(1 << index))
+        else:
+            masks[(student_id, year)] = (set_bits & ~(1 << index), clear_bits | 1 << index)
+    if not masks:
+        return
+
+    table = AttendanceBits.__table__
+    stmt = sqlite_insert(table).values(
+        student_id=bindparam('student_id'), year=bindparam('year'), present_mask=bindparam('set_bits')
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.student_id, table.c.year],
+        set_={'present_mask': table.c.present_mask.op('|')(bindparam('set_bits')).op('&')(bindparam('keep_bits'))}
+    )
+    db.session.execute(stmt, [
+        {'student_id': student_id, 'year': year, 'set_bits': set_bits, 'keep_bits': ~clear_bits}
+        for (student_id, year), (set_bits, clear_bits) in masks.items()
+    ])
+
+def rebuild_attendance_bits():
+    """Recompute every bitmask from the attendance table. Runs inside the caller's transaction."""
+    masks = {}
+    present_rows = db.session.query(Attendance.student_id, Attendance.date).filter(
+        Attendance.present == True
+    ).execution_options(yield_per=5000)
+    for student_id, day in present_rows:
+        bit = sunday_bit(day)
+        if bit is not None:
+            masks[(student_id, bit[0])] = masks.get((student_id, bit[0]), 0) | 1 << bit[1]
+
+    db.session.execute(AttendanceBits.__table__.delete())
+    if masks:
+        db.session.execute(AttendanceBits.__table__.insert(), [
+            {'student_id': student_id, 'year': year, 'present_mask': mask}
+            for (student_id, year), mask in masks.items()
+        ])
+
+def load_attendance_bitsets(student_ids, start_year, end_year):
+    """Return (sundays, {student_id: mask}) for a range of years.
+
+    Bit i of each mask is set when the student was present on sundays[i].
+    """
+    offsets = {}
+    sundays = []
+    for year in range(start_year, end_year + 1):
+        offsets[year] = len(sundays)
+        sundays.extend(get_year_sundays(year))
+
+    query = AttendanceBits.query.filter(AttendanceBits.year.between(start_year, end_year))
+    if student_ids is not None:
+        query = query.filter(AttendanceBits.student_id.in_(student_ids))
+
+    masks = {}
+    for row in query.with_entities(AttendanceBits.student_id, AttendanceBits.year, AttendanceBits.present_mask):
+        masks[row.student_id] = masks.get(row.student_id, 0) | row.present_mask << offsets[row.year]
+    return sundays, masks
+
+def bits_present_count(mask, start=0, end=None):
+    """Sundays attended between bit positions start (inclusive) and end (exclusive)"""
+    if end is not None:
+        mask &= (1 << end) - 1
+    return (mask >> start).bit_count()
+
+def bits_absence_streak(mask, length):
+    """Consecutive Sundays missed counting back from bit length - 1"""
+    mask &= (1 << length) - 1
+    return length - mask.bit_length()
+
+def bits_missed_in_window(mask, end, width):
+    """Sundays missed among the `width` Sundays ending just before bit position `end`"""
+    start = max(end - width, 0)
+    return (end - start) - bits_present_count(mask, start, end)
+
+# -------------------------------
+# Helper: Attendance report matrix
+# -------------------------------
+def get_sundays_between(year, start_month, end_month):
+    """All Sundays from start_month to end_month (inclusive) of a year"""
+    return [sunday for month in range(start_month, end_month + 1) for sunday in get_sundays(year, month)]
+
+def build_attendance_matrix(roster_query, sundays):
+    """Load a roster and its attendance as a students x Sundays boolean matrix.
+
+    Returns (students, matrix); row i of the matrix belongs to students[i].
+    """
+    students = roster_query.all()
+    matrix = np.zeros((len(students), len(sundays)), dtype=bool)
+    if not students or not sundays:
+        return students, matrix
+
+    row_of = {student.id: i for i, student in enumerate(students)}
+    col_of = {sunday: j for j, sunday in enumerate(sundays)}
+    student_ids = roster_query.with_entities(Student.id).scalar_subquery()
+    marks = db.session.query(Attendance.student_id, Attendance.date).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.date.between(sundays[0], sundays[-1]),
+        Attendance.present == True
+    ).all()
+
+    cells = [(row_of[student_id], col_of[day]) for student_id, day in marks if day in col_of]
+    if cells:
+        rows, cols = np.array(cells).T
+        matrix[rows, cols] = True
+    return students, matrix
+
+def report_roster_query(selected_class=None):
+    """Active students on an attendance report, in sheet order"""
+    query = Student.query.filter_by(status="active")
+    if selected_class:
+        query = query.filter_by(student_class=selected_class)
+    return query.order_by(Student.name)
+
+def build_attendance_report(year, start_month, end_month, selected_class=None, today=None):
+    """Everything the attendance report templates need for a class (or all classes) over a month range.
+
+    Counts and rates are taken over the Sundays up to today, so a range reaching into the
+    future is not diluted by Sundays that have not happened yet, and marks already ticked
+    for a later Sunday cannot lift a rate above 100%. The sheet still shows those marks.
+    """
+    sundays = get_sundays_between(year, start_month, end_month)
+    elapsed = bisect.bisect_right(sundays, today or date.today())
+    students, matrix = build_attendance_matrix(report_roster_query(selected_class), sundays)
+
+    counted = matrix[:, :elapsed]
+    present_counts = counted.sum(axis=1)
+    rates = np.round(100 * present_counts / elapsed) if elapsed else np.zeros(len(students))
+    sunday_headcounts = matrix.sum(axis=0)
+
+    class_of = np.array([student.student_class for student in students], dtype=object)
+    class_totals = []
+    for class_name in CLASS_NAMES:
+        in_class = class_of == class_name
+        class_size = int(in_class.sum())
+        if not class_size:
+            continue
+        present = int(counted[in_class].sum())
+        possible = class_size * elapsed
+        class_totals.append({
+            'class_name': class_name,
+            'students': class_size,
+            'present': present,
+            'possible': possible,
+            'rate': round(100 * present / possible) if possible else 0,
+            'headcounts': matrix[in_class].sum(axis=0).tolist()
+        })
+
+    possible = len(students) * elapsed
+    total_present = int(counted.sum())
+    return {
+        'sundays': sundays,
+        'elapsed_sundays': elapsed,
+        'rows': list(zip(students, matrix.tolist(), present_counts.tolist(), rates.astype(int).tolist())),
+        'sunday_headcounts': sunday_headcounts.tolist(),
+        'class_totals': class_totals,
+        'total_present': total_present,
+        'overall_rate': round(100 * total_present / possible) if possible else 0
+    }
+
+# -------------------------------
+# Helper: Attendance PDF cache
+# -------------------------------
+_pdf_pool = None
+_pdf_jobs = {}
+_pdf_lock = threading.Lock()
+
+def get_pdf_pool():
+    global _pdf_pool
+    with _pdf_lock:
+        if _pdf_pool is None:
+            # Spawn rather than fork: forking a process with scheduler and request threads can deadlock
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_pool
+
+def bump_month_versions(days):
+    """Advance the data version of every month touched by an attendance write (caller commits)"""
+    months = {(day.year, day.month) for day in days}
+    if not months:
+        return months
+    table = AttendanceMonthVersion.__table__
+    stmt = sqlite_insert(table).values(year=bindparam('year'), month=bindparam('month'), version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.year, table.c.month],
+        set_={'version': table.c.version + 1}
+    )
+    db.session.execute(stmt, [{'year': year, 'month': month} for year, month in months])
+    return months
+
+def pdf_cache_path(year, start_month, end_month, selected_class, today=None):
+    """Cache file for a report, keyed by class, months, the data version of those months,
+    the Sundays elapsed so far and the roster - all cheap to read without building the report.
+    """
+    versions = dict(db.session.query(AttendanceMonthVersion.month, AttendanceMonthVersion.version).filter(
+        AttendanceMonthVersion.year == year,
+        AttendanceMonthVersion.month.between(start_month, end_month)
+    ).all())
+    elapsed = bisect.bisect_right(get_sundays_between(year, start_month, end_month), today or date.today())
+    roster = report_roster_query(selected_class).with_entities(Student.id, Student.name).all()
+    key = (f"{[versions.get(m, 0) for m in range(start_month, end_month + 1)]}|{elapsed}"
+           f"|{','.join(f'{student_id}:{name}' for student_id, name in roster)}")
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    class_slug = re.sub(r'[^A-Za-z0-9]', '', selected_class or '') or 'all'
+    return os.path.join(PDF_CACHE_DIR, f"{year}_{start_month:02d}_{end_month:02d}_{class_slug}_{digest}.pdf")
+
+def invalidate_pdf_cache(months):
+    """Remove cached sheets covering any of the given (year, month) pairs"""
+    for year, month in months:
+        for path in glob.glob(os.path.join(PDF_CACHE_DIR, f"{year}_*.pdf")):
+            try:
+                start_month, end_month = os.path.basename(path).split('_')[1:3]
+                if int(start_month) <= month <= int(end_month):
+                    os.remove(path)
+            except (ValueError, OSError):
+                continue
+
+def remove_superseded_pdfs(cache_path):
+    """Delete older sheets for the same class and months once `cache_path` replaces them"""
+    prefix = cache_path.rsplit('_', 1)[0]
+    for path in glob.glob(f"{glob.escape(prefix)}_*.pdf"):
+        if path != cache_path:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+def _store_rendered_pdf(cache_path, future):
+    with _pdf_lock:
+        _pdf_jobs.pop(cache_path, None)
+    if future.exception() is not None:
+        print(f"PDF rendering failed: {future.exception()}")
+        return
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        temp_path = f"{cache_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(future.result())
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Failed to cache PDF {cache_path}: {e}")
+        return
+    remove_superseded_pdfs(cache_path)
+
+def render_pdf_in_pool(cache_path, build_html):
+    """Render in the process pool, sharing the job with any request already waiting on the same sheet.
+
+    `build_html` is only called when no render of this sheet is already running.
+    Returns the PDF bytes, or None if rendering is still running after PDF_WAIT_SECONDS.
+    """
+    pool = get_pdf_pool()
+    with _pdf_lock:
+        future = _pdf_jobs.get(cache_path)
+    if future is None:
+        html = build_html()
+        with _pdf_lock:
+            future = _pdf_jobs.get(cache_path)
+            if future is None:
+                future = pool.submit(html_to_pdf, html)
+                _pdf_jobs[cache_path] = future
+                future.add_done_callback(partial(_store_rendered_pdf, cache_path))
+    try:
+        return future.result(timeout=PDF_WAIT_SECONDS)
+    except FutureTimeout:
+        return None
+
+# -------------------------------
+# Helper: Student list filtering, ordering and keyset paging
+# -------------------------------
+STUDENTS_PER_PAGE = 100
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def student_search_terms(search):
+    """FTS5 query matching every word of the search as a prefix, or None if it has no words"""
+    words = re.findall(r'\w+', search)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def student_search_matches(search):
+    """Subquery of (student_id, rank) for students whose name, parent or family number match.
+
+    A match on the student's own name ranks ahead of one on the parent's name or family number.
+    """
+    return text(
+        "SELECT rowid AS student_id, bm25(student_fts, 10.0, 1.0, 1.0) AS rank "
+        "FROM student_fts WHERE student_fts MATCH :terms"
+    ).bindparams(terms=student_search_terms(search)).columns(student_id=Integer, rank=Float).subquery()
+
+def search_students(query, search, ranked=False):
+    """Restrict a Student query to search matches, optionally ordered best match first"""
+    if student_search_terms(search) is None:
+        # Nothing the index can match (e.g. only punctuation); fall back to a substring match
+        pattern = f"%{escape_like(search)}%"
+        return query.filter(or_(
+            Student.name.ilike(pattern, escape='\\'),
+            Student.parent.ilike(pattern, escape='\\'),
+            Student.family.has(Family.number.ilike(pattern, escape='\\'))
+        ))
+
+    matches = student_search_matches(search)
+    if ranked:
+        return query.join(matches, matches.c.student_id == Student.id).order_by(matches.c.rank)
+    return query.filter(Student.id.in_(select(matches.c.student_id)))
+
+def with_families(query):
+    """Outer-join each student's Family, which family_sort_keys() and family columns need"""
+    return query.outerjoin(Family, Family.id == Student.family_id)
+
+def family_sort_keys():
+    """Students without a family last, numeric family numbers in numeric order, then other family numbers.
+
+    The query must include the Family join from with_families().
+    """
+    number = func.coalesce(Family.number, '')
+    return [
+        case((number == '', 1), else_=0),
+        case((number.op('GLOB')('*[^0-9]*'), 1), else_=0),
+        func.coalesce(cast(Family.number, Integer), 0),
+        number
+    ]
+
+def resolve_family(number, parent=None, contact=None, update=False):
+    """Family for a family number, created with this parent/contact if new; None for a blank number.
+
+    An existing family's missing parent/contact are filled in from the student being saved.
+    With `update`, as when a member is edited, the member's non-blank details replace the family's.
+    """
+    number = (number or '').strip()
+    if not number:
+        return None
+    family = Family.query.filter_by(number=number).first()
+    if family is None:
+        family = Family(number=number, parent=parent or None, contact=contact or None)
+        db.session.add(family)
+    elif update:
+        family.parent = parent or family.parent
+        family.contact = contact or family.contact
+    else:
+        family.parent = family.parent or parent or None
+        family.contact = family.contact or contact or None
+    return family
+
+def resolve_family_ids(records):
+    """Swap each record's 'family_number' for a 'family_id', creating missing families in one INSERT.
+
+    As with resolve_family(), an existing family's missing parent/contact are filled in
+    from the first records that have them, with one executemany UPDATE.
+    """
+    numbers = {record['family_number'] for record in records if record['family_number']}
+    if not numbers:
+        for record in records:
+            record['family_id'] = None
+            del record['family_number']
+        return
+    details = {}
+    for record in records:
+        number = record['family_number']
+        if number:
+            found = details.setdefault(number, {'parent': None, 'contact': None})
+            found['parent'] = found['parent'] or record['parent'] or None
+            found['contact'] = found['contact'] or record['contact'] or None
+
+    ids = dict(db.session.query(Family.number, Family.id).filter(Family.number.in_(numbers)))
+    fills = [{'family_number': number, 'new_parent': found['parent'], 'new_contact': found['contact']}
+             for number, found in details.items()
+             if number in ids and (found['parent'] or found['contact'])]
+    if fills:
+        db.session.execute(
+            Family.__table__.update()
+            .where(Family.number == bindparam('family_number'))
+            .values(parent=func.coalesce(func.nullif(Family.parent, ''), bindparam('new_parent')),
+                    contact=func.coalesce(func.nullif(Family.contact, ''), bindparam('new_contact'))),
+            fills
+        )
+    missing = [{'number': number, 'created_at': datetime.now(), **found}
+               for number, found in details.items() if number not in ids]
+    if missing:
+        db.session.execute(Family.__table__.insert(), missing)
+        ids.update(db.session.query(Family.number, Family.id)
+                   .filter(Family.number.in_([family['number'] for family in missing])))
+    for record in records:
+        record['family_id'] = ids.get(record.pop('family_number'))
+
+def student_sort_keys(sort_by, group_by=None):
+    """SQL sort key columns for a student ordering, ending in the id so every key is unique"""
+    name_key = func.lower(Student.name)
+    if sort_by == 'class':
+        keys = [case({name: i for i, name in enumerate(CLASS_NAMES, 1)}, value=Student.student_class, else_=99), name_key]
+    elif sort_by == 'dob':
+        # Unknown dates of birth sort last
+        keys = [func.coalesce(Student.dob, date.max), name_key]
+    elif sort_by == 'family':
+        keys = family_sort_keys() + [name_key]
+    else:
+        keys = [name_key]
+    # Keep families together when grouping, ordered within by the chosen sort
+    if group_by == 'family' and sort_by != 'family':
+        keys = family_sort_keys() + keys
+    return keys + [Student.id]
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+
+def keyset_page(query, keys, cursor=None, per_page=STUDENTS_PER_PAGE):
+    """Return (rows, next_cursor) for the page after `cursor` in the order given by `keys`"""
+    values = decode_cursor(cursor) if cursor else None
+    if values and len(values) == len(keys):
+        query = query.filter(tuple_(*keys) > tuple_(*[literal(v) for v in values]))
+
+    width = len(query.column_descriptions)
+    rows = query.add_columns(*keys).order_by(*keys).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][width:])
+    # A single entity comes back bare; a column projection as a tuple of its columns
+    return [row[0] if width == 1 else row[:width] for row in rows], next_cursor
+
+# -------------------------------
+# Helper: Read-only student rows for list views
+# -------------------------------
+# The columns list views read. Rows are plain tuples: no identity map, change
+# tracking or lazy loading, and templates use them exactly like Student objects.
+STUDENT_ROW_COLUMNS = {
+    'id': Student.id,
+    'name': Student.name,
+    'dob': Student.dob,
+    'parent': Student.parent,
+    'contact': Student.contact,
+    'student_class': Student.student_class,
+    'status': Student.status,
+    'deletion_requested': Student.deletion_requested,
+    'profile_image': Student.profile_image,
+    'family_number': Family.number,
+}
+StudentRow = namedtuple('StudentRow', STUDENT_ROW_COLUMNS)
+
+def student_row_query(query):
+    """A Student query narrowed to the StudentRow columns (adds the Family join)"""
+    return with_families(query).with_entities(*STUDENT_ROW_COLUMNS.values())
+
+def student_rows(rows):
+    """StudentRow tuples from the rows of a student_row_query()"""
+    return [StudentRow._make(row) for row in rows]
+
+# -------------------------------
+# Helper: Dashboard roster
+# -------------------------------
+ROSTER_PAGE_SIZE = 100            # Students per /roster page
+DASHBOARD_FULL_RENDER_MAX = 200   # Larger rosters render incrementally as the user scrolls
+
+def dashboard_roster_query(selected_class=None, family_number=None):
+    """Active students shown on the dashboard, optionally narrowed to a class and a family number"""
+    query = Student.query.filter_by(status="active")
+    if selected_class:
+        query = query.filter_by(student_class=selected_class)
+    if family_number:
+        # The filter takes a family number; both lookups are indexed
+        query = query.filter(Student.family_id == select(Family.id).where(
+            Family.number == family_number.strip()).scalar_subquery())
+    return query
+
+# -------------------------------
+# Helper: Student details JSON
+# -------------------------------
+STUDENT_BATCH_MAX = 500   # Most ids one batch lookup accepts
+
+# Fields a details lookup can return, and the column each one reads
+STUDENT_DETAIL_FIELDS = {
+    'id': Student.id,
+    'name': Student.name,
+    'dob': Student.dob,
+    'parent': Student.parent,
+    'contact': Student.contact,
+    'student_class': Student.student_class,
+    'status': Student.status,
+    'family_id': Family.number,   # The family number, as forms and imports use it
+    'profile_image': Student.profile_image,
+    'profile_image_url': Student.profile_image,
+}
+
+def student_details(criteria, fields=None):
+    """Detail dicts for the students matching `criteria`, read in one query.
+
+    `fields` limits each dict to those keys (the id is always included).
+    """
+    fields = ['id'] + [f for f in (fields or STUDENT_DETAIL_FIELDS) if f != 'id']
+    columns = [STUDENT_DETAIL_FIELDS[f].label(f) for f in fields]
+    rows = with_families(db.session.query(*columns)).filter(*criteria).order_by(Student.name, Student.id)
+
+    details = []
+    for row in rows:
+        student = dict(zip(fields, row))
+        if student.get('dob'):
+            student['dob'] = student['dob'].isoformat()
+        if student.get('profile_image_url'):
+            student['profile_image_url'] = url_for('static', filename='uploads/profiles/' + student['profile_image_url'])
+        details.append(student)
+    return details
+
+# -------------------------------
+# Helper: Conditional GET (ETag / Last-Modified) and response cache
+# -------------------------------
+_response_cache = OrderedDict()   # etag -> (body, mimetype, headers); least recently used first
+_response_cache_bytes = 0
+_response_cache_lock = threading.Lock()
+
+def response_cache_get(etag):
+    with _response_cache_lock:
+        entry = _response_cache.get(etag)
+        if entry is not None:
+            _response_cache.move_to_end(etag)
+        return entry
+
+def response_cache_put(etag, body, mimetype, headers):
+    global _response_cache_bytes
+    if len(body) > RESPONSE_CACHE_MAX_ENTRY:
+        return
+    with _response_cache_lock:
+        if etag in _response_cache:
+            return
+        _response_cache[etag] = (body, mimetype, headers)
+        _response_cache_bytes += len(body)
+        while _response_cache_bytes > RESPONSE_CACHE_MAX_BYTES:
+            _, (old_body, _, _) = _response_cache.popitem(last=False)
+            _response_cache_bytes -= len(old_body)
+
+def get_data_versions(tables):
+    """Return ((table, version), ...) and the latest change time (UTC) across `tables`"""
+    rows = DataVersion.query.filter(DataVersion.name.in_(tables)).order_by(DataVersion.name).all()
+    changed_at = max((row.changed_at for row in rows), default=datetime(2000, 1, 1))
+    return tuple((row.name, row.version) for row in rows), changed_at
+
+def conditional_view(*tables, daily=False):
+    """Give a GET view ETag/Last-Modified validators derived from the data versions of `tables`.
+
+    Repeat requests get a 304 on a matching If-None-Match, or the body from the per-process LRU,
+    without running the view.
+    Only in-memory bodies are kept in the LRU; file and streamed responses just get the validators.
+    The tag covers the URL and the signed-in user; `daily` views also change with the date.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Logged-out requests redirect, and pending flash messages must be rendered fresh
+            if "user" not in session or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            # Versions are read before the view runs, so a body is never tagged older than it is
+            versions, changed_at = get_data_versions(tables)
+            if len(versions) < len(tables):
+                # No data_version rows (database not migrated): a tag could never change
+                return view(*args, **kwargs)
+            today = date.today() if daily else None
+            if today:
+                midnight = datetime.combine(today, datetime.min.time()).astimezone(timezone.utc).replace(tzinfo=None)
+                changed_at = max(changed_at, midnight)
+            key = (request.endpoint, request.full_path, session.get('user'), session.get('role'),
+                   session.get('assigned_class'), versions, today)
+            etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+            def finish(response):
+                response.set_etag(etag)
+                response.last_modified = changed_at
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+
+            # Only the tag decides a 304: changed_at has one-second precision, so If-Modified-Since
+            # cannot tell a response apart from a write made later in the same second
+            if request.if_none_match and request.if_none_match.contains(etag):
+                return finish(Response(status=304))
+
+            cached = response_cache_get(etag)
+            if cached is not None:
+                body, mimetype, headers = cached
+                return finish(Response(body, mimetype=mimetype, headers=headers))
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            # Files and streamed downloads keep streaming; only in-memory bodies go in the LRU
+            if not (response.is_streamed or response.direct_passthrough):
+                headers = [(name, value) for name, value in response.headers if name == 'Content-Disposition']
+                response_cache_put(etag, response.get_data(), response.mimetype, headers)
+            return finish(response)
+        return wrapper
+    return decorator
+
 # -------------------------------
 # Jinja Filter + Now Context
 # -------------------------------
-@app.template_filter('todatetime')
-def to_datetime_filter(s):
-    return datetime.strptime(s, "%Y-%m-%d")
+@app.template_filter('age')
+def age_filter(dob):
+    return calculate_age(dob)
 
 @app.context_processor
 def inject_now():
     return {'now': datetime.now}
 
+@app.template_global()
+def versioned_static(filename):
+    """URL of a static file that changes whenever the file does, so it can be cached for good"""
+    path = os.path.join(app.static_folder, filename)
+    version = int(os.path.getmtime(path)) if os.path.exists(path) else 0
+    return url_for('static', filename=filename, v=version)
+
+@app.after_request
+def cache_versioned_static(response):
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_VERSIONED_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
 # -------------------------------
 # Login Page
 # -------------------------------
@@ -402,8 +2080,7 @@ def register():
             return render_template("register.html")
 
     # GET request - show registration form
-    classes = ["Genesis", "Exodus", "Psalms", "Proverbs", "Revelation", "High Schoolers"]
-    return render_template("register.html", classes=classes)
+    return render_template("register.html", classes=CLASS_NAMES)
 
 # -------------------------------
 # Dashboard
@@ -426,62 +2103,33 @@ def dashboard():
         selected_class = assigned_class
 
     sundays = get_sundays(year, month)
-
-    # Find the current Sunday (today if it's Sunday, or the most recent Sunday)
-    current_sunday = None
-    if today.weekday() == 6:  # Today is Sunday
-        current_sunday = today
-    else:
-        # Find the most recent Sunday in the current month's Sundays
-        for sunday in reversed(sundays):
-            if sunday <= today:
-                current_sunday = sunday
-                break
-
-    # If no current Sunday found in this month, use today's date
-    if current_sunday is None:
-        current_sunday = today
+    current_sunday = get_current_sunday(sundays, today)
 
     # Support searching by family id (family number) in addition to class
     family_id = request.args.get("family_id")
-
-    query = Student.query.filter_by(status="active")
-    if selected_class:
-        query = query.filter_by(student_class=selected_class)
-    if family_id:
-        # family_id stored as string in the model; filter using provided value
-        query = query.filter_by(family_id=family_id)
-
-    filtered_students = query.all()
+    query = dashboard_roster_query(selected_class, family_id)
+
+    # Large rosters render in pages fetched from /roster as the user scrolls,
+    # so the first paint costs the same whatever the roster size
+    rows_mode = request.args.get("rows")
+    incremental = rows_mode == 'incremental' or (
+        rows_mode != 'all' and query.limit(DASHBOARD_FULL_RENDER_MAX + 1).count() > DASHBOARD_FULL_RENDER_MAX)
+    if incremental:
+        filtered_students, attendance_lookup, attendance_stats = [], set(), {}
+    else:
+        # Same order as /roster pages
+        filtered_students = student_rows(student_row_query(query).order_by(Student.id))
+        attendance_lookup = get_attendance_lookup(query, sundays)
+        attendance_stats = get_attendance_stats(query)
+    present_count = count_present_on(query, current_sunday) if current_sunday in sundays else 0
+    birthdays = query.filter(birthday_in_month_sql(month)).with_entities(Student.name, Student.dob).order_by(
+        func.strftime('%d', Student.dob), Student.name).all()
 
     # Check for students at risk of deactivation (for admin notification)
     at_risk_count = 0
     if session.get("role") == "admin":
-        # Get the last 4 Sundays for at-risk check
-        today = datetime.now()
-        check_sundays = []
-        current_date = today
-
-        for _ in range(4):
-            days_back = (current_date.weekday() + 1) % 7
-            if days_back == 0 and current_date.date() == today.date():
-                days_back = 7
-
-            sunday = current_date - timedelta(days=days_back)
-            check_sundays.append(sunday.date())
-            current_date = sunday - timedelta(days=1)
-
         # Count students at risk (all active students, not just filtered)
-        all_active_students = Student.query.filter_by(status='active').all()
-        for student in all_active_students:
-            missed_count = 0
-            for sunday in check_sundays:
-                attendance = Attendance.query.filter_by(student_id=student.id, date=sunday).first()
-                if not attendance or not attendance.present:
-                    missed_count += 1
-
-            if missed_count >= 3:  # At risk if missed 3+ Sundays
-                at_risk_count += 1
+        at_risk_count = count_students_at_risk()
 
     return render_template("dashboard.html",
                            students=filtered_students,
@@ -491,7 +2139,132 @@ def dashboard():
                            selected_class=selected_class,
                            current_sunday=current_sunday,
                            at_risk_count=at_risk_count,
-                           family_id=family_id)
+                           family_id=family_id,
+                           attendance_lookup=attendance_lookup,
+                           attendance_stats=attendance_stats,
+                           birthdays=birthdays,
+                           student_batch_max=STUDENT_BATCH_MAX,
+                           attendance_batch_max=ATTENDANCE_BATCH_MAX,
+                           incremental=incremental,
+                           present_count=present_count,
+                           roster_page_size=ROSTER_PAGE_SIZE)
+
+@app.route("/roster")
+@conditional_view('student', 'family', 'attendance', daily=True)
+def roster():
+    """One keyset page of the dashboard roster with that month's attendance, as JSON.
+
+    Takes the dashboard's class_name, family_id, month and year, plus `after` (the
+    previous page's `next` cursor) and `limit`. `search` (part of a name) and
+    `family_prefix` (start of a family number) apply the dashboard's search boxes,
+    which cannot filter rows that have not been fetched yet. Bit i of each
+    student's `present` is set when they were marked present on sundays[i].
+    """
+    if "user" not in session:
+        return {"error": "Unauthorized"}, 401
+
+    today = date.today()
+    try:
+        month = int(request.args.get("month", today.month))
+        year = int(request.args.get("year", today.year))
+        limit = min(max(int(request.args.get("limit", ROSTER_PAGE_SIZE)), 1), ROSTER_PAGE_SIZE)
+        sundays = get_sundays(year, month)
+    except ValueError:
+        return {"error": "month, year and limit must be numbers"}, 400
+
+    selected_class = request.args.get("class_name")
+    if session.get("role") == "teacher" and session.get("assigned_class") and not selected_class:
+        selected_class = session.get("assigned_class")
+    query = dashboard_roster_query(selected_class, request.args.get("family_id"))
+    search = request.args.get("search", "").strip()
+    if search:
+        query = query.filter(Student.name.ilike(f"%{escape_like(search)}%", escape='\\'))
+    family_prefix = request.args.get("family_prefix", "").strip()
+    if family_prefix:
+        query = query.filter(Student.family_id.in_(select(Family.id).where(
+            Family.number.ilike(f"{escape_like(family_prefix)}%", escape='\\'))))
+
+    rows, next_cursor = keyset_page(student_row_query(query), [Student.id], request.args.get("after"), limit)
+    students = student_rows(rows)
+    ids = [student.id for student in students]
+    masks = load_month_attendance_masks(ids, sundays)
+    stats = get_attendance_stats(Student.query.filter(Student.id.in_(ids)))
+
+    results = []
+    for student in students:
+        student_stats = stats.get(student.id)
+        results.append({
+            "id": student.id,
+            "name": student.name,
+            "age": calculate_age(student.dob, today),
+            "student_class": student.student_class,
+            "family_id": student.family_number,
+            "profile_image_url": url_for('static', filename='uploads/profiles/' + student.profile_image)
+                                 if student.profile_image else None,
+            "deletion_requested": bool(student.deletion_requested),
+            "attendance_rate": student_stats.attendance_rate if student_stats else None,
+            "last_present": student_stats.last_present.isoformat()
+                            if student_stats and student_stats.last_present else None,
+            "present": masks.get(student.id, 0)
+        })
+
+    return {
+        "sundays": [sunday.isoformat() for sunday in sundays],
+        "students": results,
+        "next": next_cursor
+    }
+
+# -------------------------------
+# Mobile Roll Call
+# -------------------------------
+@app.route("/roll_call")
+@conditional_view('student', 'attendance', daily=True)
+def roll_call():
+    """Attendance for the current Sunday only, for one class, sized for phones.
+
+    Teachers get their assigned class; admins choose one with ?class_name=.
+    ?format=json returns the same roll as JSON.
+    """
+    if "user" not in session:
+        return redirect(url_for("home"))
+
+    if session.get("role") == "teacher":
+        selected_class = session.get("assigned_class")
+        if not selected_class:
+            flash("You do not have an assigned class yet.", "error")
+            return redirect(url_for("dashboard"))
+    else:
+        selected_class = request.args.get("class_name")
+
+    sunday = latest_sunday()
+    students, present = [], set()
+    if selected_class:
+        # Two queries whatever the class size: the roll, then the marks for this Sunday
+        query = Student.query.filter(Student.status == "active", Student.student_class == selected_class,
+                                     Student.deletion_requested.isnot(True))
+        students = query.with_entities(Student.id, Student.name).order_by(func.lower(Student.name)).all()
+        present = {student_id for student_id, _ in get_attendance_lookup(query, [sunday])}
+
+    # Past Sundays are read-only, as on the dashboard
+    editable = sunday == date.today()
+
+    if request.args.get("format") == "json":
+        return {
+            "date": sunday.isoformat(),
+            "class_name": selected_class,
+            "editable": editable,
+            "present_count": len(present),
+            "students": [{"id": s.id, "name": s.name, "present": s.id in present} for s in students]
+        }
+
+    return render_template("roll_call.html",
+                           sunday=sunday,
+                           selected_class=selected_class,
+                           classes=CLASS_NAMES,
+                           editable=editable,
+                           students=students,
+                           present=present,
+                           attendance_batch_max=ATTENDANCE_BATCH_MAX)
 
 # -------------------------------
 # Add Student
@@ -505,54 +2278,13 @@ def add_student():
     contact = request.form.get("contact", "")
     family_id = request.form.get("family_id", "")
 
-    today = datetime.now()
-
     # Determine birth date from either dob or age input. dob takes precedence.
-    birth = None
-    if dob:
-        try:
-            birth = datetime.strptime(dob, "%Y-%m-%d")
-        except Exception:
-            flash("Invalid date of birth format. Use YYYY-MM-DD.", "error")
-            return redirect(url_for("dashboard"))
-        if birth > today:
-            flash("Date of birth cannot be in the future!", "error")
-            return redirect(url_for("dashboard"))
-        age = (today - birth).days // 365
-    elif age_input:
-        try:
-            age_int = int(age_input)
-            if age_int < 0 or age_int > 120:
-                raise ValueError
-        except Exception:
-            flash("Invalid age provided.", "error")
-            return redirect(url_for("dashboard"))
-        # Approximate birth date: set to today's date minus age years
-        try:
-            birth = today.replace(year=today.year - age_int)
-        except Exception:
-            # Fallback if replace fails (e.g., Feb 29)
-            birth = today - timedelta(days=age_int * 365)
-        age = age_int
-        # Store dob as YYYY-MM-DD string for the Student model
-        dob = birth.strftime("%Y-%m-%d")
-    else:
-        flash("Please provide either a date of birth or an age.", "error")
+    try:
+        birth, assigned_class = student_birth_and_class(dob, age_input)
+    except ValueError as e:
+        flash(str(e), "error")
         return redirect(url_for("dashboard"))
 
-    if age <= 5:
-        assigned_class = "Genesis"
-    elif age <= 7:
-        assigned_class = "Exodus"
-    elif age <= 9:
-        assigned_class = "Psalms"
-    elif age <= 11:
-        assigned_class = "Proverbs"
-    elif age <= 13:
-        assigned_class = "Revelation"
-    else:
-        assigned_class = "High Schoolers"
-
     # Handle profile image upload
     profile_image_filename = None
     if 'profile_image' in request.files:
@@ -573,12 +2305,12 @@ def add_student():
 
     student = Student(
         name=name,
-        dob=dob,
+        dob=birth,
         parent=parent,
         contact=contact,
         student_class=assigned_class,
         profile_image=profile_image_filename,
-        family_id=family_id if family_id else None
+        family=resolve_family(family_id, parent, contact)
     )
 
     db.session.add(student)
@@ -587,6 +2319,109 @@ def add_student():
     flash("Student registered successfully!", "success")
     return redirect(url_for("dashboard"))
 
+# -------------------------------
+# Bulk Student Import
+# -------------------------------
+@app.route("/import_students", methods=["GET", "POST"])
+def import_students():
+    if not session.get("role") == "admin":
+        flash("Access denied.", "danger")
+        return redirect(url_for("dashboard"))
+
+    wants_json = request.args.get("format") == "json"
+
+    if request.method == "POST":
+        resume_id = request.form.get("resume")
+        if resume_id:
+            # Continue an interrupted import from the copy kept on disk
+            job = StudentImport.query.get_or_404(resume_id)
+            if not job.resumable or not os.path.exists(job.file_path):
+                flash("That import cannot be resumed; upload the file again.", "error")
+                return redirect(url_for("import_students", job=job.id))
+            if not claim_student_import(job, ['running']):
+                flash("That import is already running.", "info")
+                return redirect(url_for("import_students", job=job.id))
+        else:
+            file = request.files.get("file")
+            file_type = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else ''
+            if file_type not in IMPORT_EXTENSIONS:
+                flash("Please choose a .csv or .xlsx file.", "error")
+                return redirect(url_for("import_students"))
+
+            file_hash = save_import_upload(file, file_type)
+            job = StudentImport.query.filter_by(file_hash=file_hash).first()
+            if job and job.status == 'done':
+                os.remove(job.file_path)
+                flash(f"This file was already imported on {job.started_at.strftime('%d %b %Y')}; nothing was added.", "info")
+                return redirect(url_for("import_students", job=job.id))
+            if job and job.status == 'failed':
+                # The same bytes would stop at the same row again
+                os.remove(job.file_path)
+                flash(f"This file could not be imported before: {job.error_list[-1]['error']}", "error")
+                return redirect(url_for("import_students", job=job.id))
+            if job is None:
+                job = StudentImport(file_hash=file_hash, filename=secure_filename(file.filename),
+                                    file_type=file_type, created_by=session.get("user"), status='importing')
+                db.session.add(job)
+                try:
+                    db.session.commit()
+                    claimed = True
+                except IntegrityError:
+                    # Another request registered the same file first
+                    db.session.rollback()
+                    job = StudentImport.query.filter_by(file_hash=file_hash).one()
+                    claimed = False
+            else:
+                claimed = False
+            if not claimed and not claim_student_import(job, ['running']):
+                flash("This file is already being imported.", "info")
+                return redirect(url_for("import_students", job=job.id))
+
+        try:
+            run_student_import(job)
+        except ImportHeaderError as e:
+            # The file itself is unusable (e.g. no Name column)
+            db.session.rollback()
+            job.status = 'failed'
+            job.errors = json.dumps([{'row': 1, 'name': '', 'error': str(e)}])
+            job.failed = 1
+            db.session.commit()
+            os.remove(job.file_path)
+            flash(f"Import failed: {str(e)}", "error")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Student import {job.id} interrupted: {str(e)}")
+            job.status = 'running'
+            db.session.commit()
+            flash(f"Import interrupted after row {job.rows_done}. Resume it to continue from there.", "warning")
+        else:
+            if job.status == 'failed':
+                flash(f"Import stopped: {job.error_list[-1]['error']}", "error")
+            else:
+                job.status = 'done'
+                flash(f"Imported {job.inserted} students; {job.failed} rows had errors.",
+                      "success" if not job.failed else "warning")
+            db.session.commit()
+            os.remove(job.file_path)
+
+        if wants_json:
+            return {
+                "id": job.id,
+                "status": job.status,
+                "rows_done": job.rows_done,
+                "inserted": job.inserted,
+                "failed": job.failed,
+                "errors": job.error_list
+            }
+        return redirect(url_for("import_students", job=job.id))
+
+    imports = StudentImport.query.order_by(StudentImport.id.desc()).limit(10).all()
+    selected_id = request.args.get("job", type=int)
+    selected = next((job for job in imports if job.id == selected_id), None)
+    if selected_id and selected is None:
+        selected = db.session.get(StudentImport, selected_id)
+    return render_template("import_students.html", imports=imports, selected=selected)
+
 
 
 # -------------------------------
@@ -651,87 +2486,381 @@ def reject_delete(student_id):
 
    #ttendance Marking
 
+ATTENDANCE_BATCH_MAX = 500    # Most marks one /mark_attendance_batch request accepts
+ATTENDANCE_INSERT_CHUNK = 100   # Marks per multi-row INSERT ... ON CONFLICT statement
+
+def last_markable_day(today=None):
+    """Marks are accepted up to the end of the current month, the last Sunday the dashboard shows"""
+    today = today or date.today()
+    return today.replace(day=calendar.monthrange(today.year, today.month)[1])
+
+def save_attendance_marks(entries):
+    """Apply a list of {student_id, date, present} marks in one transaction.
+
+    Dates must be Sundays no later than the end of the current month.
+    Returns one result dict per entry, in the order they were given.
+    """
+    results = []
+    marks = {}
+    last_day = last_markable_day()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            results.append({"ok": False, "error": "Invalid entry"})
+            continue
+        result = {"student_id": entry.get("student_id"), "date": entry.get("date")}
+        try:
+            student_id = int(entry.get("student_id"))
+            date_obj = datetime.strptime(str(entry.get("date")), "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            result.update(ok=False, error="Invalid student_id or date")
+            results.append(result)
+            continue
+        if date_obj.weekday() != 6 or date_obj > last_day:
+            result.update(ok=False, error="Attendance can only be marked for Sundays up to the end of this month")
+            results.append(result)
+            continue
+        present = entry.get("present") in (True, 1, "true", "1", "on")
+        result.update(student_id=student_id, present=present)
+        marks[(student_id, date_obj)] = present
+        results.append(result)
+
+    if not marks:
+        return results
+
+    student_ids = {student_id for student_id, _ in marks}
+    known_ids = {row.id for row in Student.query.with_entities(Student.id).filter(Student.id.in_(student_ids))}
+
+    rows = [
+        {"student_id": student_id, "date": date_obj, "present": present}
+        for (student_id, date_obj), present in marks.items()
+        if student_id in known_ids
+    ]
+    if rows:
+        update_attendance_stats({(row["student_id"], row["date"]): row["present"] for row in rows})
+        for start in range(0, len(rows), ATTENDANCE_INSERT_CHUNK):
+            stmt = sqlite_insert(Attendance).values(rows[start:start + ATTENDANCE_INSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Attendance.student_id, Attendance.date],
+                set_={"present": stmt.excluded.present}
+            )
+            db.session.execute(stmt)
+        update_attendance_bits({key: present for key, present in marks.items() if key[0] in known_ids})
+        touched_months = bump_month_versions({row["date"] for row in rows})
+        db.session.commit()
+        invalidate_pdf_cache(touched_months)
+
+    for result in results:
+        if "ok" in result:
+            continue
+        if result["student_id"] in known_ids:
+            result["ok"] = True
+        else:
+            result.update(ok=False, error="Unknown student")
+    return results
+
 @app.route("/mark_attendance", methods=["POST"])
 def mark_attendance():
     if "user" not in session:
         return redirect(url_for("home"))
 
-    student_id = request.form.get("student_id")
-    date_str = request.form.get("date")
-    present = request.form.get("present") == "true"
-
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-
-    # Check if already marked
-    record = Attendance.query.filter_by(student_id=student_id, date=date_obj).first()
-    if record:
-        record.present = present
-    else:
-        record = Attendance(student_id=student_id, date=date_obj, present=present)
-        db.session.add(record)
-
-    db.session.commit()
+    result = save_attendance_marks([{
+        "student_id": request.form.get("student_id"),
+        "date": request.form.get("date"),
+        "present": request.form.get("present")
+    }])[0]
+    if not result["ok"]:
+        return result["error"], 400
     return "Attendance marked", 200
 
+@app.route("/mark_attendance_batch", methods=["POST"])
+def mark_attendance_batch():
+    """Save up to ATTENDANCE_BATCH_MAX attendance marks in one request: {"entries": [{student_id, date, present}, ...]}"""
+    if "user" not in session:
+        return {"error": "Unauthorized"}, 401
 
-@app.context_processor
-def utility_functions():
-    def attendance_present(student_id, sunday):
-        record = Attendance.query.filter_by(student_id=student_id, date=sunday).first()
-        return record.present if record else False
-    return dict(attendance_present=attendance_present)
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get("entries") if isinstance(payload, dict) else payload
+    if not isinstance(entries, list):
+        return {"error": "Expected a list of attendance entries"}, 400
+    if len(entries) > ATTENDANCE_BATCH_MAX:
+        return {"error": f"At most {ATTENDANCE_BATCH_MAX} entries per request"}, 413
+
+    results = save_attendance_marks(entries)
+    return {
+        "results": results,
+        "saved": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"])
+    }
 
 
 @app.route("/attendance_report")
+@conditional_view('student', 'attendance', daily=True)
 def attendance_report():
     if "user" not in session:
         return redirect(url_for("home"))
 
     today = date.today()
-    month = int(request.args.get("month", today.month))
     year = int(request.args.get("year", today.year))
     selected_class = request.args.get("class_name")
 
-    sundays = get_sundays(year, month)
-
-    # Fetch students
-    if selected_class:
-        students = Student.query.filter_by(student_class=selected_class, status="active").all()
+    # A month of "all" reports the whole year; end_month extends a report over several months
+    month_arg = request.args.get("month", str(today.month))
+    if month_arg == "all":
+        month, end_month = "all", 12
+        start_month = 1
     else:
-        students = Student.query.filter_by(status="active").all()
+        month = start_month = int(month_arg)
+        end_month = int(request.args.get("end_month", start_month))
+        end_month = min(max(end_month, start_month), 12)
 
-    # Fetch all attendance records for this month
-    all_attendance = Attendance.query.filter(
-        Attendance.date.between(date(year, month, 1), date(year, month, 31))
-    ).all()
+    if request.args.get("format") == "pdf":
+        return attendance_report_pdf(month, start_month, end_month, year, selected_class)
 
-    # Create quick lookup: {(student_id, date): present}
-    attendance_map = {
-        (a.student_id, a.date): a.present for a in all_attendance
-    }
+    report = build_attendance_report(year, start_month, end_month, selected_class)
 
-    return render_template("attendance_report.html", students=students,
-                           sundays=sundays, month=month, year=year,
-                           selected_class=selected_class, attendance_map=attendance_map)
+    return render_template("attendance_report.html", month=month, end_month=end_month, year=year,
+                           selected_class=selected_class, classes=CLASS_NAMES, **report)
 
+def attendance_report_pdf(month, start_month, end_month, year, selected_class):
+    """Serve the printable sheet from the disk cache, building and rendering it off-thread on a miss"""
+    cache_path = pdf_cache_path(year, start_month, end_month, selected_class)
+    filename = f"attendance_{(selected_class or 'all').replace(' ', '_')}_{year}_{start_month:02d}"
+    if end_month != start_month:
+        filename += f"-{end_month:02d}"
 
-@app.route('/get_student/<int:student_id>')
-def get_student(student_id):
+    if os.path.exists(cache_path):
+        return send_file(cache_path, download_name=f"{filename}.pdf", mimetype='application/pdf')
+
+    def build_html():
+        report = build_attendance_report(year, start_month, end_month, selected_class)
+        return render_template("attendance_pdf.html", month=month, end_month=end_month, year=year,
+                               selected_class=selected_class, **report)
+
+    try:
+        pdf_bytes = render_pdf_in_pool(cache_path, build_html)
+    except Exception as e:
+        flash(f"Error generating PDF: {str(e)}", "error")
+        return redirect(url_for("attendance_report", month=month, end_month=end_month,
+                                year=year, class_name=selected_class))
+
+    if pdf_bytes is None:
+        # Still rendering; ask the browser to come back shortly instead of holding this worker
+        return Response(
+            "<p>Preparing your attendance sheet&hellip; this page will refresh automatically.</p>",
+            status=202,
+            headers={'Refresh': '5'}
+        )
+
+    return send_file(BytesIO(pdf_bytes), download_name=f"{filename}.pdf", mimetype='application/pdf')
+
+
+EXPORT_CHUNK_SIZE = 1000
+XLSX_MAX_ROWS = 1048576  # Excel's per-sheet row limit
+
+ATTENDANCE_EXPORT_HEADER = ['Date', 'Student ID', 'Name', 'Class', 'Family ID', 'Status', 'Present']
+
+def attendance_export_rows(start_date, end_date, classes=None):
+    """Yield attendance export rows in date order, reading the database in chunks"""
+    query = with_families(db.session.query(
+        Attendance.date, Student.id, Student.name, Student.student_class,
+        Family.number, Student.status, Attendance.present
+    ).join(Student, Student.id == Attendance.student_id)).filter(
+        Attendance.date.between(start_date, end_date)
+    )
+    if classes:
+        query = query.filter(Student.student_class.in_(classes))
+    query = query.order_by(Attendance.date, Student.student_class, Student.name)
+
+    for day, student_id, name, student_class, family_number, status, present in query.execution_options(yield_per=EXPORT_CHUNK_SIZE):
+        yield [day.isoformat(), student_id, name, student_class or '', family_number or '', status or '',
+               'Yes' if present else 'No']
+
+def stream_attendance_csv(rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ATTENDANCE_EXPORT_HEADER)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def write_attendance_xlsx(rows, fileobj):
+    """Write rows with openpyxl's write-only mode, starting a new sheet when one fills up"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    workbook = Workbook(write_only=True)
+    header_fill = PatternFill(start_color='CCE5FF', end_color='CCE5FF', fill_type='solid')
+    bold_font = Font(bold=True)
+
+    def new_sheet(number):
+        sheet = workbook.create_sheet('Attendance' if number == 1 else f'Attendance {number}')
+        header = []
+        for title in ATTENDANCE_EXPORT_HEADER:
+            cell = WriteOnlyCell(sheet, value=title)
+            cell.fill = header_fill
+            cell.font = bold_font
+            header.append(cell)
+        sheet.append(header)
+        return sheet
+
+    sheet_number = 1
+    sheet = new_sheet(sheet_number)
+    sheet_rows = 1
+    for row in rows:
+        if sheet_rows >= XLSX_MAX_ROWS:
+            sheet_number += 1
+            sheet = new_sheet(sheet_number)
+            sheet_rows = 1
+        sheet.append(row)
+        sheet_rows += 1
+    workbook.save(fileobj)
+
+@app.route("/export_attendance")
+def export_attendance():
+    """Download attendance marks for any date range and set of classes as CSV or XLSX"""
+    if "user" not in session:
+        flash("You must be logged in to download data.", "error")
+        return redirect(url_for("home"))
+
+    today = date.today()
+    try:
+        start_date = datetime.strptime(request.args.get("start", f"{today.year}-01-01"), "%Y-%m-%d").date()
+        end_date = datetime.strptime(request.args.get("end", today.isoformat()), "%Y-%m-%d").date()
+    except ValueError:
+        flash("Invalid date range. Use YYYY-MM-DD.", "error")
+        return redirect(url_for("attendance_report"))
+    if end_date < start_date:
+        flash("The end date must be after the start date.", "error")
+        return redirect(url_for("attendance_report"))
+
+    classes = [c for c in request.args.getlist("class_name") if c]
+    export_format = request.args.get("format", "csv")
+    filename = f"attendance_{start_date:%Y%m%d}_{end_date:%Y%m%d}"
+    rows = attendance_export_rows(start_date, end_date, classes)
+
+    if export_format == "xlsx":
+        # Write-only workbooks keep rows on disk, so the spooled file is what we stream back
+        output = tempfile.TemporaryFile()
+        write_attendance_xlsx(rows, output)
+        output.seek(0)
+        return send_file(
+            output,
+            download_name=f'{filename}.xlsx',
+            as_attachment=True,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+    return Response(
+        stream_with_context(stream_attendance_csv(rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+    )
+
+@app.route("/attendance_history")
+def attendance_history():
+    """Multi-year attendance summary per student, read from the compact bitsets"""
     if "user" not in session:
         return {"error": "Unauthorized"}, 401
 
-    student = Student.query.get_or_404(student_id)
+    today = date.today()
+    try:
+        start_year = int(request.args.get("start_year", today.year))
+        end_year = int(request.args.get("end_year", start_year))
+    except ValueError:
+        return {"error": "Invalid year"}, 400
+    if end_year < start_year or end_year - start_year > 50:
+        return {"error": "Invalid year range"}, 400
+    selected_class = request.args.get("class_name")
+    student_id = request.args.get("student_id", type=int)
+
+    query = Student.query.with_entities(Student.id, Student.name, Student.student_class)
+    if student_id:
+        query = query.filter(Student.id == student_id)
+    else:
+        query = query.filter_by(status="active")
+        if selected_class:
+            query = query.filter_by(student_class=selected_class)
+    students = query.all()
+
+    sundays, masks = load_attendance_bitsets([s.id for s in students], start_year, end_year)
+    stats = get_attendance_stats(query)
+    # Only count Sundays that have already happened
+    elapsed = bisect.bisect_right(sundays, today)
+
+    history = []
+    for student in students:
+        mask = masks.get(student.id, 0)
+        # A student is tracked from their first mark, as in AttendanceStats, so a
+        # newcomer is not charged with the Sundays before they joined
+        first_marked = stats[student.id].first_marked if student.id in stats else None
+        start = min(bisect.bisect_left(sundays, first_marked), elapsed) if first_marked else elapsed
+        tracked = elapsed - start
+        present = bits_present_count(mask, start, elapsed)
+        history.append({
+            "id": student.id,
+            "name": student.name,
+            "class": student.student_class,
+            "present": present,
+            "sundays": tracked,
+            "rate": round(100 * present / tracked) if tracked else None,
+            "absence_streak": min(bits_absence_streak(mask, elapsed), tracked),
+            "missed_recent": bits_missed_in_window(mask, elapsed, min(AT_RISK_WINDOW, tracked))
+        })
+
     return {
-        "id": student.id,
-        "name": student.name,
-        "dob": student.dob,
-        "parent": student.parent,
-        "contact": student.contact,
-        "student_class": student.student_class,
-        "family_id": student.family_id,
-        "profile_image": student.profile_image
+        "start_year": start_year,
+        "end_year": end_year,
+        "students": history
     }
 
+@app.route('/get_student/<int:student_id>')
+@conditional_view('student', 'family')
+def get_student(student_id):
+    if "user" not in session:
+        return {"error": "Unauthorized"}, 401
+
+    details = student_details([Student.id == student_id])
+    if not details:
+        abort(404)
+    return details[0]
+
+@app.route('/get_students')
+@conditional_view('student', 'family')
+def get_students():
+    """Details for many students in one request: ?ids=1,2,3 or ?class_name=Genesis (active students),
+    optionally narrowed with ?fields=name,dob,..."""
+    if "user" not in session:
+        return {"error": "Unauthorized"}, 401
+
+    criteria = []
+    raw_ids = ','.join(request.args.getlist('ids')).replace(' ', '')
+    if raw_ids:
+        try:
+            ids = {int(i) for i in raw_ids.split(',') if i}
+        except ValueError:
+            return {"error": "ids must be a comma-separated list of student ids"}, 400
+        if len(ids) > STUDENT_BATCH_MAX:
+            return {"error": f"At most {STUDENT_BATCH_MAX} ids per request"}, 400
+        criteria.append(Student.id.in_(ids))
+    class_name = request.args.get('class_name')
+    if class_name:
+        criteria += [Student.status == 'active', Student.student_class == class_name]
+    if not criteria:
+        return {"error": "Give ids or class_name"}, 400
+
+    fields = [f for f in request.args.get('fields', '').replace(' ', '').split(',') if f]
+    unknown = [f for f in fields if f not in STUDENT_DETAIL_FIELDS]
+    if unknown:
+        return {"error": f"Unknown fields: {', '.join(unknown)}",
+                "fields": list(STUDENT_DETAIL_FIELDS)}, 400
+
+    return {"students": student_details(criteria, fields)}
+
 @app.route('/edit_student', methods=['GET', 'POST'])
 def edit_student():
     if not session.get("role") == "admin":
@@ -741,12 +2870,17 @@ def edit_student():
     student_id = request.form.get("student_id")
     student = Student.query.get_or_404(student_id)
 
+    dob = parse_dob(request.form.get("dob"))
+    if dob is None:
+        flash("Invalid date of birth. Use YYYY-MM-DD and a date that is not in the future.", "error")
+        return redirect(url_for("dashboard"))
+
     # Update basic info
     student.name = request.form.get("name")
-    student.dob = request.form.get("dob")
+    student.dob = dob
     student.parent = request.form.get("parent", "")
     student.contact = request.form.get("contact", "")
-    student.family_id = request.form.get("family_id", "") or None
+    student.family = resolve_family(request.form.get("family_id", ""), student.parent, student.contact, update=True)
 
     # Handle profile image update
     if 'profile_image' in request.files:
@@ -771,22 +2905,8 @@ def edit_student():
                 flash(f"Error uploading image: {str(e)}", "warning")
 
     # Recalculate class based on age
-    birth = datetime.strptime(student.dob, "%Y-%m-%d")
-    today = datetime.now()
-    age = (today - birth).days // 365
-
-    if age <= 5:
-        student.student_class = "Genesis"
-    elif age <= 7:
-        student.student_class = "Exodus"
-    elif age <= 9:
-        student.student_class = "Psalms"
-    elif age <= 11:
-        student.student_class = "Proverbs"
-    elif age <= 13:
-        student.student_class = "Revelation"
-    else:
-        student.student_class = "High Schoolers"
+    age = calculate_age(student.dob)
+    student.student_class = class_for_age(age)
 
     db.session.commit()
     flash(f"Student '{student.name}' updated successfully!", "success")
@@ -800,19 +2920,16 @@ def student_detail(student_id):
 
     student = Student.query.get_or_404(student_id)
 
-    # Calculate age
-    from datetime import datetime
-    birth_date = datetime.strptime(student.dob, "%Y-%m-%d")
-    today = datetime.now()
-    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+    age = calculate_age(student.dob)
 
     # Format date for display
-    formatted_date = birth_date.strftime("%B %d, %Y")
+    formatted_date = student.dob.strftime("%B %d, %Y") if student.dob else "Unknown"
 
     return render_template("student_detail.html",
                          student=student,
                          age=age,
-                         formatted_date=formatted_date)
+                         formatted_date=formatted_date,
+                         stats=student.attendance_stats)
 
 @app.route("/all_students")
 def all_students():
@@ -825,119 +2942,42 @@ def all_students():
     group_by = request.args.get("group_by")
     sort_by = request.args.get("sort_by", "name")
     search = request.args.get("search", "").strip()
-    
-    class_list = ['Genesis', 'Exodus', 'Psalms', 'Proverbs', 'Revelation', 'High Schoolers']
+    cursor = request.args.get("after")
+
+    class_list = CLASS_NAMES
 
     # Base query
     query = Student.query.filter_by(status="active")
-    
+
     # Apply class filter if selected
     if selected_class:
         query = query.filter_by(student_class=selected_class)
-    
-    # Get all students for statistics
-    all_students = query.all()
-    
-    # Calculate statistics
-    total_students = len(all_students)
-    total_families = len(set(s.family_id for s in all_students if s.family_id))
-    selected_class_count = len([s for s in all_students if not selected_class or s.student_class == selected_class])
-    
+
+    # Statistics come from one aggregate query rather than loading the roster
+    total_students, total_families = query.with_entities(
+        func.count(Student.id), func.count(func.distinct(Student.family_id))
+    ).one()
+
     # Apply search filter if provided
     if search:
-        search = search.lower()
-        students = [s for s in all_students if
-                   search in s.name.lower() or
-                   (s.parent and search in s.parent.lower()) or
-                   (s.family_id and search in s.family_id.lower())]
-    else:
-        students = all_students
-    
-    # Sorting functions
-    def name_sort_key(s):
-        return s.name.lower() if s.name else ''
-
-    def family_sort_key(s):
-        # First sort by whether they have a family ID
-        has_family = 0 if s.family_id else 1
-        # Then by the family ID (numeric if possible)
-        try:
-            family_num = int(s.family_id) if s.family_id else float('inf')
-            family_key = (has_family, family_num)
-        except (ValueError, TypeError):
-            family_key = (has_family, s.family_id or '')
-        # Finally by name
-        return (family_key, name_sort_key(s))
-
-    def class_sort_key(s):
-        # Define class order based on typical age progression
-        class_order = {
-            'Genesis': 1,
-            'Exodus': 2,
-            'Psalms': 3,
-            'Proverbs': 4,
-            'Revelation': 5,
-            'High Schoolers': 6
-        }
-        return (class_order.get(s.student_class, 99), name_sort_key(s))
+        query = search_students(query, search)
 
-    def dob_sort_key(s):
-        try:
-            # Parse date string to datetime object for proper comparison
-            dob = datetime.strptime(s.dob, "%Y-%m-%d")
-            return (dob, name_sort_key(s))
-        except (ValueError, TypeError):
-            # Handle invalid dates by putting them at the end
-            return (datetime.max, name_sort_key(s))
-
-    # Apply sorting based on selected option
-    if sort_by == 'family':
-        students = sorted(students, key=family_sort_key)
-    elif sort_by == 'class':
-        students = sorted(students, key=class_sort_key)
-    elif sort_by == 'dob':
-        students = sorted(students, key=dob_sort_key)
-    else:  # sort_by == 'name'
-        students = sorted(students, key=name_sort_key)
+    rows, next_cursor = keyset_page(student_row_query(query), student_sort_keys(sort_by, group_by), cursor)
+    students = student_rows(rows)
 
-    # If requested, group students by family_id while maintaining sort order
+    # If requested, group this page's students by family, keeping their order
     grouped_families = None
     if group_by == 'family':
-        # First, group students by family while preserving their order
         families = {}
-        ordered_families = []
-        
         for s in students:
-            key = s.family_id if s.family_id else 'No Family'
-            if key not in families:
-                families[key] = []
-                ordered_families.append(key)
-            families[key].append(s)
-
-        # For each family group, maintain the sort order of students within
-        for family in families.values():
-            if sort_by == 'class':
-                family.sort(key=class_sort_key)
-            elif sort_by == 'dob':
-                family.sort(key=dob_sort_key)
-            else:
-                family.sort(key=name_sort_key)
-
-        # Create the final ordered list of (family_id, students) tuples
-        def family_group_sort_key(family_id):
-            if family_id == 'No Family':
-                return (1, float('inf'))
-            try:
-                return (0, int(family_id))
-            except (ValueError, TypeError):
-                return (0, str(family_id))
-
-        # Create final sorted list of family groups
-        if sort_by == 'family':
-            # When sorting by family, sort the family groups themselves
-            ordered_families.sort(key=family_group_sort_key)
-        
-        grouped_families = [(k, families[k]) for k in ordered_families]
+            families.setdefault(s.family_number or 'No Family', []).append(s)
+        grouped_families = [(family, members, False) for family, members in families.items()]
+        # A family split by the page break is marked as continued from the previous page
+        values = decode_cursor(cursor) if cursor else None
+        if grouped_families and values:
+            previous = with_families(Student.query.filter_by(id=values[-1])).with_entities(Family.number).first()
+            if previous and (previous[0] or 'No Family') == grouped_families[0][0]:
+                grouped_families[0] = grouped_families[0][:2] + (True,)
 
     return render_template("all_students.html",
                          students=students,
@@ -947,9 +2987,96 @@ def all_students():
                          group_by=group_by,
                          sort_by=sort_by,
                          search=search,
-                         total_students=total_students,)
+                         total_students=total_students,
+                         total_families=total_families,
+                         next_cursor=next_cursor,
+                         is_first_page=not cursor)
+
+@app.route("/search_students")
+def search_students_json():
+    """Typeahead: best-matching active students for a partial name, parent or family number"""
+    if "user" not in session:
+        return {"error": "Unauthorized"}, 401
+
+    search = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    if not search:
+        return {"results": []}
+
+    query = Student.query.filter_by(status="active")
+    if request.args.get("class_name"):
+        query = query.filter_by(student_class=request.args.get("class_name"))
+    students = search_students(query, search, ranked=True).limit(limit).all()
+
+    return {"results": [{
+        "id": student.id,
+        "name": student.name,
+        "parent": student.parent,
+        "family_id": student.family_number,
+        "student_class": student.student_class
+    } for student in students]}
+
+STUDENT_EXPORT_HEADER = ['Family ID', 'Name', 'Class', 'Birth Date', 'Parent', 'Contact']
+
+def write_students_xlsx(rows, widths, fileobj):
+    """Write the family-grouped student list with openpyxl's write-only mode, styling rows as they are emitted.
+
+    `rows` must arrive grouped by family; only one family is held in memory at a time.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, NamedStyle, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Students')
+    # Named styles are applied by name, which is much cheaper per cell than setting font and fill
+    for style_name, colour in (('Student header', 'CCE5FF'), ('Family heading', 'F2F2F2')):
+        workbook.add_named_style(NamedStyle(
+            name=style_name,
+            font=Font(bold=True),
+            fill=PatternFill(start_color=colour, end_color=colour, fill_type='solid')
+        ))
+
+    # Auto-adjust column widths (must be set before the first row in write-only mode)
+    family_width, name_width, class_width, parent_width, contact_width = widths
+    for idx, width in enumerate([family_width, name_width, class_width, 10, parent_width, contact_width], 1):
+        title_width = len(STUDENT_EXPORT_HEADER[idx - 1])
+        sheet.column_dimensions[get_column_letter(idx)].width = max(width or 0, title_width, len('N/A')) + 2
+
+    def styled(values, style_name):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.style = style_name
+            cells.append(cell)
+        return cells
+
+    def write_family(family_number, members):
+        first = members[0]
+        parent = first.family_parent or first.parent or 'N/A'
+        contact = first.family_contact or first.contact or 'N/A'
+        sheet.append(styled([f"Family {family_number}", '', '', '', parent, contact], 'Family heading'))
+        for student in sorted(members, key=lambda x: x.name.lower()):
+            sheet.append(['', f"  • {student.name}", student.student_class, student.dob, '', ''])
+        # Add a blank row between families
+        sheet.append([])
+
+    sheet.append(styled(STUDENT_EXPORT_HEADER, 'Student header'))
+    family_number, members = None, []
+    for row in rows:
+        row_family = row.family_number or 'No Family ID'
+        if members and row_family != family_number:
+            write_family(family_number, members)
+            members = []
+        family_number = row_family
+        members.append(row)
+    if members:
+        write_family(family_number, members)
+    workbook.save(fileobj)
 
 @app.route("/download_students")
+@conditional_view('student', 'family')
 def download_students():
     if "user" not in session:
         flash("You must be logged in to download data.", "error")
@@ -968,110 +3095,32 @@ def download_students():
     if selected_class:
         query = query.filter_by(student_class=selected_class)
     
-    # Get filtered students
-    students = query.all()
-    
     # Apply search filter if provided
     if search:
-        students = [s for s in students if search.lower() in s.name.lower()]
-
-    # Sort students based on sort_by parameter
-    if sort_by == "name":
-        students.sort(key=lambda x: x.name.lower())
-    elif sort_by == "class":
-        students.sort(key=lambda x: (x.student_class, x.name.lower()))
-    elif sort_by == "age":
-        students.sort(key=lambda x: (x.birth_date if x.birth_date else date.max))
-    elif sort_by == "family":
-        students.sort(key=lambda x: (str(x.family_id), x.name.lower()))
-
-    # Group students by family
-    families = {}
-    for student in students:
-        family_id = student.family_id or 'No Family ID'
-        if family_id not in families:
-            families[family_id] = {
-                'students': [],
-                'parent': student.parent,
-                'contact': student.contact
-            }
-        families[family_id]['students'].append(student)
-
-    # Prepare data for Excel with family grouping
-    data = []
-    for family_id, family in sorted(families.items()):
-        # Add family header
-        data.append({
-            'Family ID': f"Family {family_id}",
-            'Name': '',
-            'Class': '',
-            'Birth Date': '',
-            'Parent': family['parent'] or 'N/A',
-            'Contact': family['contact'] or 'N/A'
-        })
-        # Add students in the family
-        for student in sorted(family['students'], key=lambda x: x.name.lower()):
-            data.append({
-                'Family ID': '',  # Empty for students in family
-                'Name': f"  • {student.name}",  # Indent student names
-                'Class': student.student_class,
-                'Birth Date': student.dob,
-                'Parent': '',  # Empty for students in family
-                'Contact': ''  # Empty for students in family
-            })
-        # Add a blank row between families
-        data.append({
-            'Family ID': '',
-            'Name': '',
-            'Class': '',
-            'Birth Date': '',
-            'Parent': '',
-            'Contact': ''
-        })
-    df = pd.DataFrame(data)
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Students')
-        
-        # Get the worksheet
-        worksheet = writer.sheets['Students']
-        
-        # Auto-adjust columns width
-        for idx, col in enumerate(df.columns):
-            max_length = max(
-                df[col].astype(str).apply(len).max(),
-                len(str(col))
-            ) + 2
-            worksheet.column_dimensions[chr(65 + idx)].width = max_length
-            
-        # Format the worksheet
-        from openpyxl.styles import Font, PatternFill, Alignment
-        
-        # Define styles
-        header_fill = PatternFill(start_color='CCE5FF', end_color='CCE5FF', fill_type='solid')
-        family_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
-        bold_font = Font(bold=True)
-        
-        # Format header row
-        for cell in worksheet[1]:
-            cell.fill = header_fill
-            cell.font = bold_font
-        
-        # Format family rows and their students
-        row = 2  # Start after header
-        while row <= len(data):
-            cell = worksheet.cell(row=row, column=1)
-            if cell.value and cell.value.startswith('Family'):
-                # Family header row
-                for col in range(1, len(df.columns) + 1):
-                    cell = worksheet.cell(row=row, column=col)
-                    cell.fill = family_fill
-                    cell.font = bold_font
-            row += 1
-    
+        query = search_students(query, search)
+
+    # Families in the same order as the all-students page; members follow the chosen sort
+    # so a family without its own parent/contact shows those of its first student
+    query = with_families(query)
+    rows = query.with_entities(
+        Student.name, Student.student_class, Student.dob, Student.parent, Student.contact,
+        Family.number.label('family_number'), Family.parent.label('family_parent'),
+        Family.contact.label('family_contact')
+    ).order_by(*family_sort_keys(), *student_sort_keys(sort_by)).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+    # Column widths come from the data, measured in SQL so the rows are only read once
+    widths = query.with_entities(
+        func.max(func.length(func.coalesce(Family.number, 'No Family ID'))) + len("Family "),
+        func.max(func.length(Student.name)) + 4,
+        func.max(func.length(Student.student_class)),
+        func.max(func.length(func.coalesce(Family.parent, Student.parent))),
+        func.max(func.length(func.coalesce(Family.contact, Student.contact)))
+    ).one()
+
+    output = tempfile.TemporaryFile()
+    write_students_xlsx(rows, widths, output)
     output.seek(0)
-    
+
     return send_file(
         output,
         download_name=f'students_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
@@ -1240,37 +3289,15 @@ def promote_students():
         promotion_type = request.form.get('promotion_type')
 
         if promotion_type == 'automatic':
-            # Automatic promotion based on age
-            students = Student.query.filter_by(status='active').all()
-            promoted_count = 0
-
-            for student in students:
-                birth_date = datetime.strptime(student.dob, "%Y-%m-%d")
-                today = datetime.now()
-                age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-
-                # Determine correct class based on current age
-                if age <= 5:
-                    new_class = "Genesis"
-                elif age <= 7:
-                    new_class = "Exodus"
-                elif age <= 9:
-                    new_class = "Psalms"
-                elif age <= 11:
-                    new_class = "Proverbs"
-                elif age <= 13:
-                    new_class = "Revelation"
-                else:
-                    new_class = "High Schoolers"
-
-                # Only update if class needs to change
-                if student.student_class != new_class:
-                    old_class = student.student_class
-                    student.student_class = new_class
-                    promoted_count += 1
-
-                    # Log the promotion
-                    print(f"Promoted {student.name} from {old_class} to {new_class} (Age: {age})")
+            # Automatic promotion based on age, applied in one transaction
+            plan = plan_promotions()
+            promoted_count = apply_promotions(plan)
+
+            # Log the promotions
+            for item in plan:
+                if item['needs_promotion']:
+                    print(f"Promoted {item['student'].name} from {item['current_class']} "
+                          f"to {item['suggested_class']} (Age: {item['age']})")
 
             db.session.commit()
             flash(f"Successfully promoted {promoted_count} students to age-appropriate classes!", "success")
@@ -1284,62 +3311,44 @@ def promote_students():
                 flash("Please select students and a target class.", "error")
                 return redirect(url_for('promote_students'))
 
-            promoted_count = 0
-            for student_id in selected_students:
-                student = Student.query.get(student_id)
-                if student:
-                    old_class = student.student_class
-                    student.student_class = new_class
-                    promoted_count += 1
-                    print(f"Manually moved {student.name} from {old_class} to {new_class}")
+            if new_class not in CLASS_NAMES:
+                flash("Please choose a valid target class.", "error")
+                return redirect(url_for('promote_students'))
+
+            # One read for the log, then one UPDATE per batch of ids
+            ids = parse_student_ids(selected_students)
+            moving = db.session.query(Student.name, Student.student_class).filter(
+                Student.id.in_(ids), Student.student_class.isnot(new_class)).all() if ids else []
+            promoted_count = set_student_class(ids, new_class)
+            for name, old_class in moving:
+                print(f"Manually moved {name} from {old_class} to {new_class}")
 
             db.session.commit()
             flash(f"Successfully moved {promoted_count} students to {new_class}!", "success")
 
         return redirect(url_for('promote_students'))
 
-    # GET request - show promotion interface
-    students = Student.query.filter_by(status='active').all()
-
-    # Calculate age and suggested class for each student
-    student_data = []
-    for student in students:
-        birth_date = datetime.strptime(student.dob, "%Y-%m-%d")
-        today = datetime.now()
-        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-
-        # Determine suggested class based on age
-        if age <= 5:
-            suggested_class = "Genesis"
-        elif age <= 7:
-            suggested_class = "Exodus"
-        elif age <= 9:
-            suggested_class = "Psalms"
-        elif age <= 11:
-            suggested_class = "Proverbs"
-        elif age <= 13:
-            suggested_class = "Revelation"
-        else:
-            suggested_class = "High Schoolers"
-
-        needs_promotion = student.student_class != suggested_class
-
-        student_data.append({
-            'student': student,
-            'age': age,
-            'current_class': student.student_class,
-            'suggested_class': suggested_class,
-            'needs_promotion': needs_promotion
-        })
+    # GET request - show promotion interface (the plan doubles as a diff preview)
+    student_data = plan_promotions()
+
+    if request.args.get('format') == 'json':
+        return {
+            "changes": [{
+                "id": item['student'].id,
+                "name": item['student'].name,
+                "age": item['age'],
+                "from": item['current_class'],
+                "to": item['suggested_class']
+            } for item in student_data if item['needs_promotion']],
+            "unknown_dob": [item['student'].id for item in student_data if item['age'] is None]
+        }
 
     # Sort by those needing promotion first
     student_data.sort(key=lambda x: (not x['needs_promotion'], x['student'].name))
 
-    classes = ["Genesis", "Exodus", "Psalms", "Proverbs", "Revelation", "High Schoolers"]
-
     return render_template("promote_students.html",
                          student_data=student_data,
-                         classes=classes)
+                         classes=CLASS_NAMES)
 
 @app.route('/manage_status', methods=['GET', 'POST'])
 def manage_status():
@@ -1355,26 +3364,22 @@ def manage_status():
             flash("Please select at least one student.", "error")
             return redirect(url_for('manage_status'))
 
-        updated_count = 0
-        for student_id in selected_students:
-            student = Student.query.get(student_id)
-            if student:
-                if action == 'activate':
-                    student.status = 'active'
-                elif action == 'deactivate':
-                    student.status = 'inactive'
-                updated_count += 1
+        if action not in ('activate', 'deactivate'):
+            flash("Unknown action.", "error")
+            return redirect(url_for('manage_status'))
 
+        updated_count = set_student_status(selected_students, 'active' if action == 'activate' else 'inactive')
         db.session.commit()
         status_text = "activated" if action == 'activate' else "deactivated"
         flash(f"Successfully {status_text} {updated_count} students!", "success")
 
         return redirect(url_for('manage_status'))
 
-    # GET request - show status management interface
-    students = Student.query.all()
-    active_students = [s for s in students if s.status == 'active']
-    inactive_students = [s for s in students if s.status == 'inactive']
+    # GET request - show status management interface; each bucket is an indexed
+    # (status, lower(name)) range, and deleted students are never loaded
+    by_name = func.lower(Student.name)
+    active_students = student_rows(student_row_query(Student.query.filter(Student.status == 'active')).order_by(by_name))
+    inactive_students = student_rows(student_row_query(Student.query.filter(Student.status == 'inactive')).order_by(by_name))
 
     return render_template("manage_status.html",
                          active_students=active_students,
@@ -1386,56 +3391,28 @@ def check_attendance_deactivation():
         flash("Access denied.", "danger")
         return redirect(url_for("dashboard"))
 
-    # Get the last 4 Sundays
-    today = datetime.now()
-    sundays = []
-    current_date = today
-
-    # Find the last 4 Sundays
-    for _ in range(4):
-        # Go back to find the most recent Sunday
-        days_back = (current_date.weekday() + 1) % 7
-        if days_back == 0 and current_date.date() == today.date():
-            days_back = 7  # If today is Sunday, go back to previous Sunday
-
-        sunday = current_date - timedelta(days=days_back)
-        sundays.append(sunday.date())
-        current_date = sunday - timedelta(days=1)  # Move to day before this Sunday
-
-    # Get all active students
-    active_students = Student.query.filter_by(status='active').all()
+    # Find active students who missed every one of the last 4 Sundays
+    sundays, at_risk = get_students_at_risk(threshold=DEACTIVATION_THRESHOLD)
     deactivated_count = 0
     deactivated_students = []
 
-    for student in active_students:
-        # Check attendance for the last 4 Sundays
-        missed_count = 0
-        attendance_details = []
-
-        for sunday in sundays:
-            attendance = Attendance.query.filter_by(
-                student_id=student.id,
-                date=sunday
-            ).first()
-
-            if not attendance or not attendance.present:
-                missed_count += 1
-                attendance_details.append(f"{sunday.strftime('%m/%d/%Y')}: Absent")
-            else:
-                attendance_details.append(f"{sunday.strftime('%m/%d/%Y')}: Present")
+    for entry in at_risk:
+        student = entry['student']
+        attendance_details = [
+            f"{sunday.strftime('%m/%d/%Y')}: {'Present' if present else 'Absent'}"
+            for sunday, present in entry['attendance']
+        ]
 
-        # If student missed all 4 Sundays, deactivate them
-        if missed_count >= 4:
-            student.status = 'inactive'
-            deactivated_count += 1
-            deactivated_students.append({
-                'name': student.name,
-                'class': student.student_class,
-                'attendance': attendance_details
-            })
+        deactivated_count += 1
+        deactivated_students.append({
+            'name': student.name,
+            'class': student.student_class,
+            'attendance': attendance_details
+        })
 
-            print(f"Auto-deactivated {student.name} for missing {missed_count}/4 Sundays")
+        print(f"Auto-deactivated {student.name} for missing {entry['missed_count']}/{len(sundays)} Sundays")
 
+    set_student_status([entry['student'].id for entry in at_risk], 'inactive')
     db.session.commit()
 
     if deactivated_count > 0:
@@ -1452,53 +3429,28 @@ def check_attendance_deactivation():
     return redirect(url_for("manage_status"))
 
 @app.route('/auto_attendance_check')
+@conditional_view('student', 'attendance', daily=True)
 def auto_attendance_check():
     """Automatic check that can be called periodically"""
     if not session.get("role") == "admin":
         return {"error": "Access denied"}, 403
 
-    # Get the last 4 Sundays
-    today = datetime.now()
-    sundays = []
-    current_date = today
-
-    for _ in range(4):
-        days_back = (current_date.weekday() + 1) % 7
-        if days_back == 0 and current_date.date() == today.date():
-            days_back = 7
-
-        sunday = current_date - timedelta(days=days_back)
-        sundays.append(sunday.date())
-        current_date = sunday - timedelta(days=1)
-
-    active_students = Student.query.filter_by(status='active').all()
+    _, at_risk = get_students_at_risk()
     students_at_risk = []
 
-    for student in active_students:
-        missed_count = 0
-        recent_attendance = []
-
-        for sunday in sundays:
-            attendance = Attendance.query.filter_by(
-                student_id=student.id,
-                date=sunday
-            ).first()
-
-            if not attendance or not attendance.present:
-                missed_count += 1
-                recent_attendance.append({"date": sunday.strftime('%m/%d'), "present": False})
-            else:
-                recent_attendance.append({"date": sunday.strftime('%m/%d'), "present": True})
-
-        if missed_count >= 3:  # At risk if missed 3+ (will be deactivated at 4)
-            students_at_risk.append({
-                'id': student.id,
-                'name': student.name,
-                'class': student.student_class,
-                'missed_count': missed_count,
-                'attendance': recent_attendance,
-                'will_deactivate': missed_count >= 4
-            })
+    for entry in at_risk:
+        student = entry['student']
+        students_at_risk.append({
+            'id': student.id,
+            'name': student.name,
+            'class': student.student_class,
+            'missed_count': entry['missed_count'],
+            'attendance': [
+                {"date": sunday.strftime('%m/%d'), "present": present}
+                for sunday, present in entry['attendance']
+            ],
+            'will_deactivate': entry['missed_count'] >= DEACTIVATION_THRESHOLD
+        })
 
     return {
         'students_at_risk': students_at_risk,
@@ -1514,28 +3466,37 @@ def admin_teachers():
         flash("Access denied.", "danger")
         return redirect(url_for("dashboard"))
 
-    # Get all users
-    pending_teachers = User.query.filter_by(status='pending', role='teacher').all()
-    active_teachers = User.query.filter_by(status='active', role='teacher').all()
-    suspended_teachers = User.query.filter_by(status='suspended', role='teacher').all()
-    rejected_teachers = User.query.filter_by(status='rejected', role='teacher').all()
+    # Load teachers and class-assigned users together, then bucket them by status
+    users = User.query.filter(
+        (User.role == 'teacher') | ((User.status == 'active') & User.assigned_class.isnot(None))
+    ).order_by(User.id).all()
+    teachers_by_status = {'pending': [], 'active': [], 'suspended': [], 'rejected': []}
+    class_teachers = {}
+    for user in users:
+        if user.role == 'teacher' and user.status in teachers_by_status:
+            teachers_by_status[user.status].append(user)
+        if user.status == 'active' and user.assigned_class:
+            class_teachers.setdefault(user.assigned_class, user)
+
+    # Active student counts for every class in one grouped query
+    student_counts = dict(db.session.query(Student.student_class, func.count(Student.id)).filter(
+        Student.status == 'active'
+    ).group_by(Student.student_class).all())
 
     # Get class assignment overview
-    classes = ["Genesis", "Exodus", "Psalms", "Proverbs", "Revelation", "High Schoolers"]
+    classes = CLASS_NAMES
     class_assignments = {}
     for class_name in classes:
-        teacher = User.query.filter_by(assigned_class=class_name, status='active').first()
-        student_count = Student.query.filter_by(student_class=class_name, status='active').count()
         class_assignments[class_name] = {
-            'teacher': teacher,
-            'student_count': student_count
+            'teacher': class_teachers.get(class_name),
+            'student_count': student_counts.get(class_name, 0)
         }
 
     return render_template("admin_teachers.html",
-                         pending_teachers=pending_teachers,
-                         active_teachers=active_teachers,
-                         suspended_teachers=suspended_teachers,
-                         rejected_teachers=rejected_teachers,
+                         pending_teachers=teachers_by_status['pending'],
+                         active_teachers=teachers_by_status['active'],
+                         suspended_teachers=teachers_by_status['suspended'],
+                         rejected_teachers=teachers_by_status['rejected'],
                          class_assignments=class_assignments,
                          classes=classes)
 
@@ -1660,6 +3621,8 @@ def delete_student(student_id):
     try:
         # Delete associated attendance records first (to maintain referential integrity)
         Attendance.query.filter_by(student_id=student_id).delete()
+        AttendanceStats.query.filter_by(student_id=student_id).delete()
+        AttendanceBits.query.filter_by(student_id=student_id).delete()
 
         # Delete the student
         db.session.delete(student)
@@ -1929,7 +3892,8 @@ def delete_backup(filename):
 # -------------------------------
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        run_migrations()
+        warn_missing_indexes()
         create_default_users()
         
         # Initialize backup config and schedule backups
@@ -1937,6 +3901,10 @@ if __name__ == "__main__":
             default_config = BackupConfig()
             db.session.add(default_config)
             db.session.commit()
-        schedule_backups()
+        # The debug reloader runs this block in a watcher process as well as in the server
+        # it restarts; only the server (WERKZEUG_RUN_MAIN) schedules jobs
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            schedule_backups()
+            schedule_class_reassignment()
         
     app.run(debug=True)
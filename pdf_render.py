@@ -0,0 +1,21 @@
+"""PDF rendering for the attendance sheet process pool.
+
+Pool workers are spawned rather than forked, so they never inherit locks held
+by the scheduler or request threads. Spawned workers still import the parent's
+main module: under gunicorn that is the server, but under `python app.py` each
+worker re-imports app.py as __mp_main__, which is why app.py keeps its
+import-time side effects behind IN_PDF_WORKER. Rendering lives here so that a
+worker only needs this module and xhtml2pdf to run a job.
+"""
+from io import BytesIO
+
+
+def html_to_pdf(html):
+    """Render an HTML document to PDF bytes"""
+    from xhtml2pdf import pisa
+
+    output = BytesIO()
+    result = pisa.CreatePDF(html, dest=output, encoding='utf-8')
+    if result.err:
+        raise RuntimeError(f"PDF rendering failed with {result.err} error(s)")
+    return output.getvalue()
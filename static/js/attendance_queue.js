@@ -0,0 +1,50 @@
+// Attendance marks are collected and sent to /mark_attendance_batch together after a short
+// pause; used by the dashboard and the mobile roll call.
+//
+//   const queue = createAttendanceQueue({ batchMax: 500, onSaved: data => ..., onError: error => ... });
+//   queue.add(studentId, date, present);
+//
+// Marks still waiting when the page is closed are sent with sendBeacon.
+function createAttendanceQueue(options) {
+    const batchMax = options.batchMax;
+    const pending = new Map();
+    let timer = null;
+
+    function add(studentId, date, present) {
+        pending.set(`${studentId}|${date}`, { student_id: studentId, date: date, present: present });
+        clearTimeout(timer);
+        timer = setTimeout(flush, options.delay || 800);
+    }
+
+    function flush(useBeacon) {
+        clearTimeout(timer);
+        if (pending.size === 0) return;
+        const entries = [...pending.values()];
+        pending.clear();
+        // The server rejects requests with more than batchMax marks
+        for (let start = 0; start < entries.length; start += batchMax) {
+            send(JSON.stringify({ entries: entries.slice(start, start + batchMax) }), useBeacon);
+        }
+    }
+
+    function send(body, useBeacon) {
+        if (useBeacon === true && navigator.sendBeacon) {
+            navigator.sendBeacon('/mark_attendance_batch', new Blob([body], { type: 'application/json' }));
+            return;
+        }
+        fetch('/mark_attendance_batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: body
+        })
+        .then(response => {
+            if (!response.ok) throw new Error(`Attendance not saved (${response.status})`);
+            return response.json();
+        })
+        .then(data => options.onSaved && options.onSaved(data))
+        .catch(error => options.onError && options.onError(error));
+    }
+
+    window.addEventListener('pagehide', () => flush(true));
+    return { add: add, flush: flush };
+}
@@ -0,0 +1,24 @@
+// Mobile roll call: marks are batched and sent together after a short pause
+(function () {
+    const list = document.getElementById('rollList');
+    const date = list.dataset.date;
+    const presentCounter = document.getElementById('presentCount');
+    const saveStatus = document.getElementById('saveStatus');
+    const queue = createAttendanceQueue({
+        batchMax: parseInt(list.dataset.batchMax, 10),
+        onSaved: data => {
+            saveStatus.textContent = data.failed ? `${data.failed} not saved - please refresh` : 'Saved';
+        },
+        onError: () => {
+            saveStatus.textContent = 'Not saved - check your connection and refresh';
+        }
+    });
+
+    list.addEventListener('change', function (event) {
+        const cb = event.target;
+        if (!cb.matches('input[type="checkbox"]') || cb.disabled) return;
+        queue.add(cb.dataset.sid, date, cb.checked);
+        presentCounter.textContent = parseInt(presentCounter.textContent, 10) + (cb.checked ? 1 : -1);
+        saveStatus.textContent = 'Saving…';
+    });
+})();
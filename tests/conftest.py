@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+import app as register
+from app import app, db, Student
+
+# Requests in tests must not register scheduler jobs
+app.config['TESTING'] = True
+
+
+@pytest.fixture
+def session():
+    """Run against a private in-memory database instead of instance/church_register.db"""
+    engines = db._app_engines[app]
+    saved = engines[None]
+    engines[None] = create_engine('sqlite://', poolclass=StaticPool)
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+    engines[None].dispose()
+    engines[None] = saved
+
+
+@pytest.fixture
+def add_student(session):
+    """Add an active Psalms student (flushed, so it has an id); keywords override the defaults"""
+    def add(name='Ruth', **values):
+        student = Student(name=name, **{'dob': date(2018, 5, 1), 'student_class': 'Psalms',
+                                        'status': 'active', **values})
+        session.add(student)
+        session.flush()
+        return student
+    return add
+
+
+@pytest.fixture
+def signed_in_client():
+    """Test client with a signed-in session; the username is the role"""
+    def sign_in(role='admin', assigned_class=None):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s['user'] = role
+            s['role'] = role
+            if assigned_class:
+                s['assigned_class'] = assigned_class
+        return client
+    return sign_in
+
+
+@pytest.fixture
+def set_today(monkeypatch):
+    """Make date.today() inside app.py return a fixed day"""
+    def set_day(today):
+        class FixedDate(date):
+            @classmethod
+            def today(cls):
+                return today
+        monkeypatch.setattr(register, 'date', FixedDate)
+    return set_day
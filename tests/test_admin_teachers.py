@@ -0,0 +1,34 @@
+from flask import template_rendered
+
+from app import app, User
+
+
+def test_overview_buckets_teachers_and_counts_classes(session, add_student, signed_in_client):
+    session.add_all([
+        User(username='ana', password='x', role='teacher', status='active', assigned_class='Psalms'),
+        User(username='ben', password='x', role='teacher', status='active', assigned_class='Psalms'),
+        User(username='cy', password='x', role='teacher', status='pending'),
+        User(username='dee', password='x', role='teacher', status='suspended', assigned_class='Exodus'),
+        User(username='boss', password='x', role='admin', status='active', assigned_class='Genesis'),
+    ])
+    add_student('Ruth')
+    add_student('Abel')
+    add_student('Cain', status='inactive')
+    add_student('Seth', student_class='Exodus')
+    session.commit()
+
+    rendered = []
+    record = lambda sender, template, context, **extra: rendered.append(context)
+    with template_rendered.connected_to(record, app):
+        assert signed_in_client().get('/admin/teachers').status_code == 200
+    context = rendered[0]
+
+    assert [u.username for u in context['active_teachers']] == ['ana', 'ben']
+    assert [u.username for u in context['pending_teachers']] == ['cy']
+    assert [u.username for u in context['suspended_teachers']] == ['dee']
+    assignments = context['class_assignments']
+    # The first active user assigned to a class is its teacher, admins included
+    assert assignments['Psalms']['teacher'].username == 'ana'
+    assert assignments['Genesis']['teacher'].username == 'boss'
+    assert assignments['Exodus']['teacher'] is None
+    assert {name: a['student_count'] for name, a in assignments.items() if a['student_count']} == {'Psalms': 2, 'Exodus': 1}
@@ -0,0 +1,24 @@
+import re
+
+from app import Family
+
+
+def test_family_split_by_the_page_break_is_marked_continued(session, add_student, signed_in_client):
+    first, second = Family(number='1'), Family(number='2')
+    session.add_all([first, second])
+    session.flush()
+    for i in range(99):
+        add_student(f'Child {i:02}', family_id=first.id)
+    for name in ('Ann', 'Bea', 'Cal'):
+        add_student(name, family_id=second.id)
+    session.commit()
+    client = signed_in_client()
+
+    page = client.get('/all_students?group_by=family').get_data(as_text=True)
+    assert 'Family: 1\n' in page and 'Family: 2\n' in page
+    assert '(continued)' not in page
+    cursor = re.search(r'after=([^"&]+)', page).group(1)
+
+    page = client.get(f'/all_students?group_by=family&after={cursor}').get_data(as_text=True)
+    assert 'Family: 2 (continued)' in page
+    assert 'Bea' in page and 'Cal' in page and 'Ann' not in page
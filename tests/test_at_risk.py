@@ -0,0 +1,32 @@
+from datetime import date
+
+from app import Student, Attendance, count_students_at_risk, get_students_at_risk
+
+
+def test_one_engine_flags_and_deactivates(session, add_student, signed_in_client, set_today):
+    # The window is the four Sundays before Tuesday 10 March 2026: 15 Feb to 8 Mar
+    set_today(date(2026, 3, 10))
+    window = [date(2026, 3, 8), date(2026, 3, 1), date(2026, 2, 22), date(2026, 2, 15)]
+    once, twice, never = add_student('Once'), add_student('Twice'), add_student('Never')
+    add_student('Away', status='inactive')
+    session.add_all([Attendance(student_id=once.id, date=window[1], present=True),
+                     Attendance(student_id=once.id, date=window[0], present=False),
+                     Attendance(student_id=twice.id, date=window[0], present=True),
+                     Attendance(student_id=twice.id, date=window[3], present=True),
+                     # Outside the window
+                     Attendance(student_id=never.id, date=date(2026, 2, 8), present=True)])
+    session.commit()
+
+    sundays, at_risk = get_students_at_risk()
+    assert sundays == window
+    flagged = {entry['student'].name: entry for entry in at_risk}
+    assert {name: entry['missed_count'] for name, entry in flagged.items()} == {'Once': 3, 'Never': 4}
+    assert [present for _, present in flagged['Once']['attendance']] == [False, True, False, False]
+    assert count_students_at_risk() == 2
+
+    report = signed_in_client().get('/auto_attendance_check').get_json()
+    assert {s['name']: s['will_deactivate'] for s in report['students_at_risk']} == {'Once': False, 'Never': True}
+
+    signed_in_client().post('/check_attendance_deactivation')
+    statuses = dict(session.query(Student.name, Student.status))
+    assert statuses == {'Once': 'active', 'Twice': 'active', 'Never': 'inactive', 'Away': 'inactive'}
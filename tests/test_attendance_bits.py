@@ -0,0 +1,60 @@
+from datetime import date
+
+import app as register
+from app import (Attendance, save_attendance_marks, AttendanceBits, get_year_sundays, load_attendance_bitsets,
+                 rebuild_attendance_bits, update_attendance_bits)
+
+
+def stored_masks(session):
+    return {(row.student_id, row.year): row.present_mask for row in session.query(AttendanceBits)}
+
+
+def test_incremental_bits_match_a_rebuild(session, add_student):
+    ruth, abel = add_student('Ruth'), add_student('Abel')
+
+    rounds = [
+        {(ruth.id, date(2025, 12, 28)): True, (ruth.id, date(2026, 1, 4)): True, (abel.id, date(2026, 1, 4)): True},
+        # Clearing one bit keeps the others; a weekday mark has no bit
+        {(ruth.id, date(2026, 1, 4)): False, (ruth.id, date(2026, 3, 8)): True, (abel.id, date(2026, 1, 5)): True},
+        {(ruth.id, date(2026, 1, 4)): True, (abel.id, date(2026, 1, 4)): False},
+    ]
+    for marks in rounds:
+        for (student_id, day), present in marks.items():
+            mark = session.query(Attendance).filter_by(student_id=student_id, date=day).first()
+            if mark:
+                mark.present = present
+            else:
+                session.add(Attendance(student_id=student_id, date=day, present=present))
+        update_attendance_bits(marks)
+        session.flush()
+    incremental = stored_masks(session)
+
+    rebuild_attendance_bits()
+    session.flush()
+    rebuilt = stored_masks(session)
+
+    # A cleared mask may stay behind as a zero row; a rebuild simply omits it
+    assert {key: mask for key, mask in incremental.items() if mask} == rebuilt
+    assert rebuilt[(ruth.id, 2026)] == 0b1000000001
+
+    sundays, masks = load_attendance_bitsets([ruth.id], 2025, 2026)
+    assert len(sundays) == len(get_year_sundays(2025)) + len(get_year_sundays(2026))
+    assert [sundays[i] for i in range(len(sundays)) if masks[ruth.id] >> i & 1] == [
+        date(2025, 12, 28), date(2026, 1, 4), date(2026, 3, 8)]
+
+
+def test_history_tracks_students_from_their_first_mark(session, add_student, signed_in_client,
+                                                       set_today, tmp_path, monkeypatch):
+    monkeypatch.setattr(register, 'PDF_CACHE_DIR', str(tmp_path))
+    set_today(date(2026, 3, 10))
+    regular, newcomer = add_student('Regular'), add_student('Newcomer')
+    add_student('Unmarked')
+    session.commit()
+    save_attendance_marks(
+        [{'student_id': regular.id, 'date': '2026-01-04', 'present': True}]
+        + [{'student_id': newcomer.id, 'date': day, 'present': False} for day in ('2026-03-01', '2026-03-08')])
+
+    history = signed_in_client().get('/attendance_history?start_year=2026').get_json()['students']
+
+    summary = {s['name']: (s['sundays'], s['present'], s['absence_streak'], s['missed_recent']) for s in history}
+    assert summary == {'Regular': (10, 1, 9, 4), 'Newcomer': (2, 0, 2, 2), 'Unmarked': (0, 0, 0, 0)}
@@ -0,0 +1,46 @@
+import csv
+from datetime import date
+from io import BytesIO, StringIO
+
+from openpyxl import load_workbook
+
+import app as register
+from app import Attendance, ATTENDANCE_EXPORT_HEADER
+
+
+def add_marks(session, add_student):
+    ruth, cain = add_student('Ruth'), add_student('Cain', student_class='Exodus')
+    session.add_all([Attendance(student_id=ruth.id, date=date(2026, 3, 8), present=True),
+                     Attendance(student_id=cain.id, date=date(2026, 3, 1), present=False),
+                     Attendance(student_id=ruth.id, date=date(2026, 4, 5), present=True)])
+    session.commit()
+    return ruth, cain
+
+
+def test_csv_streams_in_date_order_and_filters_classes(session, add_student, signed_in_client, monkeypatch):
+    monkeypatch.setattr(register, 'EXPORT_CHUNK_SIZE', 1)
+    ruth, cain = add_marks(session, add_student)
+    client = signed_in_client()
+
+    response = client.get('/export_attendance?start=2026-03-01&end=2026-03-31')
+    assert response.is_streamed
+    rows = list(csv.reader(StringIO(response.get_data(as_text=True))))
+    assert rows == [ATTENDANCE_EXPORT_HEADER,
+                    ['2026-03-01', str(cain.id), 'Cain', 'Exodus', '', 'active', 'No'],
+                    ['2026-03-08', str(ruth.id), 'Ruth', 'Psalms', '', 'active', 'Yes']]
+
+    response = client.get('/export_attendance?start=2026-01-01&end=2026-12-31&class_name=Psalms')
+    assert [row[0] for row in csv.reader(StringIO(response.get_data(as_text=True)))][1:] == ['2026-03-08', '2026-04-05']
+
+
+def test_xlsx_starts_a_new_sheet_when_one_fills(session, add_student, signed_in_client, monkeypatch):
+    monkeypatch.setattr(register, 'XLSX_MAX_ROWS', 3)
+    add_marks(session, add_student)
+
+    response = signed_in_client().get('/export_attendance?start=2026-01-01&end=2026-12-31&format=xlsx')
+
+    workbook = load_workbook(BytesIO(response.get_data()))
+    assert workbook.sheetnames == ['Attendance', 'Attendance 2']
+    first, second = ([list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook.worksheets)
+    assert first[0] == second[0] == ATTENDANCE_EXPORT_HEADER
+    assert [row[0] for row in first[1:] + second[1:]] == ['2026-03-01', '2026-03-08', '2026-04-05']
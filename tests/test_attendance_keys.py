@@ -0,0 +1,35 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import Attendance, migrate_attendance_keys
+
+
+def test_migration_keeps_the_latest_duplicate_and_adds_the_key(session, add_student):
+    student = add_student()
+    # An attendance table from before the unique key
+    session.execute(text("DROP TABLE attendance"))
+    session.execute(text(
+        "CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id INTEGER NOT NULL, "
+        "date DATE NOT NULL, present BOOLEAN)"
+    ))
+    session.execute(text("INSERT INTO attendance (student_id, date, present) VALUES (:sid, :day, :present)"), [
+        {'sid': student.id, 'day': '2026-03-08', 'present': True},
+        {'sid': student.id, 'day': '2026-03-08', 'present': False},
+        {'sid': student.id, 'day': '2026-03-15', 'present': True},
+    ])
+    session.commit()
+
+    migrate_attendance_keys()
+
+    marks = dict(session.query(Attendance.date, Attendance.present))
+    assert marks == {date(2026, 3, 8): False, date(2026, 3, 15): True}
+    indexes = {row[1] for row in session.execute(text("PRAGMA index_list(attendance)"))}
+    assert {'uq_attendance_student_date', 'ix_attendance_date'} <= indexes
+
+    session.add(Attendance(student_id=student.id, date=date(2026, 3, 15), present=False))
+    with pytest.raises(IntegrityError):
+        session.commit()
+    session.rollback()
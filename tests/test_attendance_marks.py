@@ -0,0 +1,65 @@
+from datetime import date
+
+import pytest
+
+import app as register
+from app import Attendance, AttendanceBits, save_attendance_marks
+
+
+@pytest.fixture(autouse=True)
+def pdf_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(register, 'PDF_CACHE_DIR', str(tmp_path))
+
+
+def test_marks_upsert_and_report_each_entry(session, add_student):
+    student = add_student()
+    session.commit()
+
+    save_attendance_marks([{'student_id': student.id, 'date': '2026-03-01', 'present': True}])
+    results = save_attendance_marks([
+        {'student_id': student.id, 'date': '2026-03-01', 'present': False},
+        # A repeated mark in the same request: the last one wins
+        {'student_id': student.id, 'date': '2026-03-08', 'present': False},
+        {'student_id': str(student.id), 'date': '2026-03-08', 'present': 'on'},
+        {'student_id': student.id + 1, 'date': '2026-03-08', 'present': True},
+        {'student_id': 'x', 'date': '2026-03-08'},
+        'not a mark',
+    ])
+
+    assert [r['ok'] for r in results] == [True, True, True, False, False, False]
+    assert results[3]['error'] == 'Unknown student'
+    assert results[4]['error'] == 'Invalid student_id or date'
+    marks = dict(session.query(Attendance.date, Attendance.present).filter_by(student_id=student.id))
+    assert marks == {date(2026, 3, 1): False, date(2026, 3, 8): True}
+    assert session.query(Attendance).count() == 2
+    assert student.attendance_stats.present_count == 1
+
+
+def test_only_sundays_up_to_this_month_are_marked(session, add_student, set_today):
+    set_today(date(2026, 3, 10))
+    student = add_student()
+    session.commit()
+
+    results = save_attendance_marks([
+        {'student_id': student.id, 'date': day, 'present': True}
+        for day in ('2026-03-29', '2026-03-10', '2026-04-05', '2025-12-28')
+    ])
+
+    assert [r['ok'] for r in results] == [True, False, False, True]
+    assert 'Sundays' in results[1]['error']
+    # Both rollups see the same marks
+    assert student.attendance_stats.present_count == 2
+    assert session.query(AttendanceBits).count() == 2
+
+
+def test_batches_are_capped_and_written_in_chunks(session, add_student, signed_in_client, monkeypatch):
+    monkeypatch.setattr(register, 'ATTENDANCE_BATCH_MAX', 4)
+    monkeypatch.setattr(register, 'ATTENDANCE_INSERT_CHUNK', 2)
+    students = [add_student(f'Student {i}') for i in range(5)]
+    session.commit()
+    client = signed_in_client()
+    entries = [{'student_id': s.id, 'date': '2026-03-08', 'present': True} for s in students]
+
+    assert client.post('/mark_attendance_batch', json={'entries': entries}).status_code == 413
+    saved = client.post('/mark_attendance_batch', json={'entries': entries[:4]}).get_json()
+    assert saved['saved'] == 4 and session.query(Attendance).count() == 4
@@ -0,0 +1,46 @@
+import os
+from datetime import date
+
+import app as register
+from app import (Attendance, build_attendance_report, bump_month_versions,
+                 pdf_cache_path, remove_superseded_pdfs)
+
+
+def test_rates_ignore_sundays_still_to_come(session, add_student):
+    # March 2026 has five Sundays: the 1st, 8th, 15th, 22nd and 29th
+    student = add_student()
+    session.add_all([Attendance(student_id=student.id, date=day, present=True)
+                     for day in (date(2026, 3, 1), date(2026, 3, 8), date(2026, 3, 22))])
+    session.commit()
+
+    report = build_attendance_report(2026, 3, 3, today=date(2026, 3, 10))
+
+    assert len(report['sundays']) == 5
+    assert report['elapsed_sundays'] == 2
+    assert report['rows'][0][2:] == (2, 100)
+    assert report['overall_rate'] == 100
+    assert report['class_totals'][0]['possible'] == 2
+    # The mark already ticked for the 22nd shows on the sheet but is not counted yet
+    assert report['class_totals'][0]['present'] == report['total_present'] == 2
+    assert report['class_totals'][0]['rate'] == 100
+    assert report['sunday_headcounts'] == [1, 1, 0, 1, 0]
+
+
+def test_new_pdf_replaces_the_stale_sheet_for_its_class(session, add_student, tmp_path, monkeypatch):
+    monkeypatch.setattr(register, 'PDF_CACHE_DIR', str(tmp_path))
+    add_student()
+    session.commit()
+    today = date(2026, 3, 10)
+
+    stale = pdf_cache_path(2026, 3, 3, 'Psalms', today)
+    other = pdf_cache_path(2026, 3, 3, 'High Schoolers', today)
+    bump_month_versions([date(2026, 3, 8)])
+    session.commit()
+    fresh = pdf_cache_path(2026, 3, 3, 'Psalms', today)
+    assert fresh != stale
+
+    for path in (stale, other, fresh):
+        open(path, 'wb').close()
+    remove_superseded_pdfs(fresh)
+
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in (other, fresh))
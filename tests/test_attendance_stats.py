@@ -0,0 +1,50 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import app as register
+from app import Attendance, AttendanceStats, refresh_attendance_stats, save_attendance_marks
+
+
+@pytest.fixture(autouse=True)
+def pdf_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(register, 'PDF_CACHE_DIR', str(tmp_path))
+
+
+def rollup(session):
+    return {row.student_id: (row.present_count, row.marked_count, row.first_marked, row.last_present)
+            for row in session.query(AttendanceStats)}
+
+
+def test_incremental_rollup_matches_a_rebuild(session, add_student, set_today):
+    set_today(date(2026, 3, 10))
+    students = [add_student(f'Student {i}').id for i in range(3)]
+    # A legacy mark on a weekday is not counted by either path
+    session.add(Attendance(student_id=students[0], date=date(2026, 2, 3), present=True))
+    session.commit()
+    sundays = [date(2026, 1, 4) + timedelta(weeks=i) for i in range(13)]
+
+    rng = random.Random(7)
+    for _ in range(40):
+        marks = [{'student_id': rng.choice(students), 'date': rng.choice(sundays).isoformat(),
+                  'present': rng.random() < 0.6} for _ in range(rng.randint(1, 4))]
+        save_attendance_marks(marks)
+        incremental = rollup(session)
+        refresh_attendance_stats()
+        assert incremental == rollup(session)
+
+
+def test_rate_counts_marks_ahead_of_today(session, add_student, set_today):
+    set_today(date(2026, 3, 10))
+    student = add_student()
+    session.commit()
+    save_attendance_marks([{'student_id': student.id, 'date': day, 'present': True}
+                           for day in ('2026-03-01', '2026-03-08', '2026-03-22')])
+
+    stats = student.attendance_stats
+    assert (stats.present_count, stats.sundays_tracked, stats.attendance_rate) == (3, 4, 75)
+
+    save_attendance_marks([{'student_id': student.id, 'date': '2026-03-22', 'present': False}])
+    session.refresh(stats)
+    assert (stats.present_count, stats.last_present, stats.attendance_rate) == (2, date(2026, 3, 8), 100)
@@ -0,0 +1,87 @@
+from datetime import date
+
+import app as register
+from app import (Student, JobState, BIRTHDAY_JOB, age_class_sql, ages_on, claim_job_window, classes_for_ages,
+                 reassign_classes_by_birthday)
+
+
+def test_birthday_within_band_keeps_manual_placement(session, add_student):
+    today = date(2026, 3, 10)
+    session.add(JobState(name=BIRTHDAY_JOB, high_water=date(2026, 3, 9)))
+    # Turns 7 today: Exodus both before and after, but placed in Psalms by hand
+    add_student('Placed', dob=date(2019, 3, 10))
+    # Turns 8 today: leaves the Exodus band for Psalms
+    add_student('Crossing', dob=date(2018, 3, 10), student_class='Exodus')
+    session.commit()
+
+    assert reassign_classes_by_birthday(today) == 1
+    classes = dict(session.query(Student.name, Student.student_class))
+    assert classes == {'Placed': 'Psalms', 'Crossing': 'Psalms'}
+
+
+def test_sql_age_band_matches_the_numpy_bands(session, add_student):
+    today = date(2026, 2, 28)
+    dobs = [date(2021, 2, 28), date(2021, 3, 1), date(2020, 2, 29), date(2019, 2, 28),
+            date(2017, 12, 31), date(2014, 2, 28), date(2010, 1, 1), date(2000, 6, 15)]
+    for i, dob in enumerate(dobs):
+        add_student(f'S{i}', dob=dob)
+    add_student('Unknown', dob=None)
+
+    bands = dict(session.query(Student.name, age_class_sql(today)))
+    expected = classes_for_ages(ages_on(dobs, today))
+    assert [bands[f'S{i}'] for i in range(len(dobs))] == list(expected)
+    assert bands['Unknown'] is None
+
+
+def test_gap_of_a_year_moves_only_students_whose_band_changed(session, add_student):
+    today = date(2026, 3, 10)
+    session.add(JobState(name=BIRTHDAY_JOB, high_water=date(2025, 1, 1)))
+    # Exodus on both dates, placed in Psalms by hand
+    add_student('Placed', dob=date(2018, 12, 1))
+    # Turned 8 in the gap
+    add_student('Crossing', dob=date(2017, 6, 1), student_class='Exodus')
+    session.commit()
+
+    assert reassign_classes_by_birthday(today) == 1
+    classes = dict(session.query(Student.name, Student.student_class))
+    assert classes == {'Placed': 'Psalms', 'Crossing': 'Psalms'}
+
+
+def test_first_run_records_the_high_water_mark_only(session, add_student):
+    add_student('Crossing', dob=date(2018, 3, 10), student_class='Exodus')
+    session.commit()
+
+    assert reassign_classes_by_birthday(date(2026, 3, 10)) == 0
+    assert session.get(JobState, BIRTHDAY_JOB).high_water == date(2026, 3, 10)
+    assert session.query(Student.student_class).scalar() == 'Exodus'
+
+
+def test_only_one_process_claims_each_window(session):
+    since, today = date(2026, 3, 9), date(2026, 3, 10)
+    assert claim_job_window(BIRTHDAY_JOB, None, since)
+    assert not claim_job_window(BIRTHDAY_JOB, None, since)
+    assert claim_job_window(BIRTHDAY_JOB, since, today)
+    # A worker that read the mark before the first one moved it finds nothing to claim
+    assert not claim_job_window(BIRTHDAY_JOB, since, today)
+
+
+def test_worker_that_loses_the_claim_moves_nobody(session, add_student, monkeypatch):
+    session.add(JobState(name=BIRTHDAY_JOB, high_water=date(2026, 3, 9)))
+    add_student('Crossing', dob=date(2018, 3, 10), student_class='Exodus')
+    session.commit()
+    monkeypatch.setattr(register, 'claim_job_window', lambda name, since, today: False)
+
+    assert reassign_classes_by_birthday(date(2026, 3, 10)) == 0
+    assert session.query(Student.student_class).scalar() == 'Exodus'
+
+
+def test_first_request_registers_the_job_outside_tests(session, signed_in_client, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(register, 'schedule_class_reassignment', lambda: scheduled.append(True))
+    client = signed_in_client()
+    client.get('/dashboard')
+    assert scheduled == []
+
+    monkeypatch.setattr(register.app, 'testing', False)
+    client.get('/dashboard')
+    assert scheduled == [True]
@@ -0,0 +1,34 @@
+from sqlalchemy import event
+
+import app as register
+from app import db, Student, set_student_class, set_student_status, update_students
+
+
+def test_updates_run_in_batches_of_ids(session, add_student, monkeypatch):
+    monkeypatch.setattr(register, 'STUDENT_UPDATE_BATCH', 3)
+    ids = [add_student(f'Student {i}', student_class='Exodus').id for i in range(7)]
+    session.commit()
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    # Form values arrive as strings; repeats and junk are dropped
+    changed = update_students([str(i) for i in ids] + [str(ids[0]), 'x', ''], student_class='Psalms')
+
+    assert changed == 7
+    assert [s.split()[0] for s in statements] == ['UPDATE'] * 3
+    assert {c for c, in session.query(Student.student_class)} == {'Psalms'}
+
+
+def test_status_and_class_changes_skip_rows_already_there(session, add_student):
+    active = [add_student('Ruth').id, add_student('Abel').id]
+    inactive = [add_student('Cain', student_class='Exodus', status='inactive').id]
+    deleted = [add_student('Seth', student_class='Exodus', status='deleted').id]
+    session.commit()
+
+    assert set_student_status(active + inactive + deleted, 'inactive') == 2
+    session.commit()
+    statuses = dict(session.query(Student.id, Student.status))
+    assert [statuses[i] for i in active + inactive + deleted] == ['inactive', 'inactive', 'inactive', 'deleted']
+
+    assert set_student_class(active + inactive, 'Psalms') == 1
@@ -0,0 +1,43 @@
+import app as register
+from app import migrate_data_versions
+
+
+def test_unmigrated_database_gets_no_validators(session, signed_in_client):
+    response = signed_in_client().get('/roll_call?class_name=Psalms')
+    assert response.status_code == 200
+    assert response.headers.get('ETag') is None
+
+
+def test_downloads_are_tagged_but_not_buffered(session, add_student, signed_in_client):
+    migrate_data_versions()
+    add_student()
+    session.commit()
+    register._response_cache.clear()
+    client = signed_in_client()
+
+    response = client.get('/download_students')
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert not register._response_cache
+
+    repeat = client.get('/download_students', headers={'If-None-Match': response.headers['ETag']})
+    assert repeat.status_code == 304
+
+    page = client.get('/roll_call?class_name=Psalms')
+    assert page.headers['ETag'] and len(register._response_cache) == 1
+
+
+def test_if_modified_since_alone_never_gets_a_304(session, add_student, signed_in_client):
+    migrate_data_versions()
+    register._response_cache.clear()
+    client = signed_in_client()
+
+    first = client.get('/roll_call?class_name=Psalms')
+    # A write in the same second leaves Last-Modified unchanged
+    add_student()
+    session.commit()
+
+    repeat = client.get('/roll_call?class_name=Psalms',
+                        headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert repeat.status_code == 200
+    assert repeat.headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,41 @@
+import re
+from datetime import date
+
+from sqlalchemy import event
+
+from app import db, Attendance
+
+
+def checked_cells(html):
+    cells = re.findall(r'data-sid="(\d+)"\s+data-date="([\d-]+)"\s+(checked)?', html)
+    return {(int(sid), day) for sid, day, checked in cells if checked}
+
+
+def count_queries(client, url):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        html = client.get(url).get_data(as_text=True)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return html, len(statements)
+
+
+def test_grid_is_prefetched_whatever_the_roster_size(session, add_student, signed_in_client):
+    ruth, abel = add_student('Ruth'), add_student('Abel')
+    session.add_all([Attendance(student_id=ruth.id, date=date(2026, 3, 8), present=True),
+                     Attendance(student_id=abel.id, date=date(2026, 3, 8), present=False),
+                     Attendance(student_id=abel.id, date=date(2026, 3, 15), present=True)])
+    session.commit()
+    client = signed_in_client()
+    url = '/dashboard?month=3&year=2026&rows=all'
+
+    client.get(url)  # The first request also runs the one-off index check
+    html, small = count_queries(client, url)
+    assert checked_cells(html) == {(ruth.id, '2026-03-08'), (abel.id, '2026-03-15')}
+
+    for i in range(20):
+        add_student(f'Student {i}')
+    session.commit()
+    assert count_queries(client, url)[1] == small
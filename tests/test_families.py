@@ -0,0 +1,84 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from app import Student, Family, migrate_student_search, migrate_student_table, resolve_family_ids, search_students
+
+
+def create_legacy_students(session, rows):
+    """The student table as it was before families: free-text family numbers and text dates"""
+    session.execute(text("DROP TABLE student"))
+    session.execute(text(
+        "CREATE TABLE student (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, dob VARCHAR(20), "
+        "parent VARCHAR(100), contact VARCHAR(50), student_class VARCHAR(50), status VARCHAR(10), "
+        "deletion_requested BOOLEAN, profile_image VARCHAR(200), family_id VARCHAR(50))"
+    ))
+    session.execute(text(
+        "INSERT INTO student (name, dob, parent, contact, student_class, status, family_id) "
+        "VALUES (:name, :dob, :parent, :contact, 'Psalms', 'active', :family)"
+    ), rows)
+    session.commit()
+
+
+def search_names(search):
+    return sorted(name for name, in search_students(Student.query, search).with_entities(Student.name))
+
+
+def test_migration_groups_students_into_families(session):
+    create_legacy_students(session, [
+        {'name': 'Ruth', 'dob': '2018-05-01', 'parent': '', 'contact': None, 'family': ' 120 '},
+        {'name': 'Naomi', 'dob': '01/02/2016', 'parent': 'Elimelech', 'contact': '0700', 'family': '120'},
+        {'name': 'Boaz', 'dob': '2017-03-04', 'parent': 'Salmon', 'contact': '0711', 'family': '120'},
+        {'name': 'Abel', 'dob': '2019-07-08', 'parent': 'Adam', 'contact': None, 'family': ''},
+    ])
+
+    migrate_student_table()
+    migrate_student_search()
+
+    family = session.query(Family).one()
+    assert (family.number, family.parent, family.contact) == ('120', 'Elimelech', '0700')
+    members = dict(session.query(Student.name, Student.family_id))
+    assert members == {'Ruth': family.id, 'Naomi': family.id, 'Boaz': family.id, 'Abel': None}
+    assert session.query(Student).filter_by(name='Naomi').one().dob == date(2016, 2, 1)
+    assert search_names('120') == ['Boaz', 'Naomi', 'Ruth']
+
+
+def test_search_index_follows_family_changes(session, add_student):
+    migrate_student_search()
+    family, other = Family(number='120'), Family(number='7')
+    session.add_all([family, other])
+    session.flush()
+    add_student('Ruth', family_id=family.id)
+    add_student('Abel', family_id=other.id)
+    session.commit()
+    assert search_names('120') == ['Ruth']
+
+    # Renumbering a family reaches every member
+    family.number = '450'
+    session.commit()
+    assert search_names('120') == [] and search_names('450') == ['Ruth']
+
+    # Moving a student to another family does too
+    session.query(Student).filter_by(name='Abel').one().family_id = family.id
+    session.commit()
+    assert search_names('450') == ['Abel', 'Ruth'] and search_names('7') == []
+
+
+def test_import_fills_blank_details_on_existing_families(session):
+    session.add_all([Family(number='7', parent='Ama', contact=''), Family(number='8')])
+    session.commit()
+    records = [
+        {'family_number': '7', 'parent': 'Kojo', 'contact': ''},
+        {'family_number': '7', 'parent': '', 'contact': '0244'},
+        {'family_number': '8', 'parent': '', 'contact': ''},
+        {'family_number': '9', 'parent': '', 'contact': '0555'},
+        {'family_number': '9', 'parent': 'Esi', 'contact': '0999'},
+        {'family_number': '', 'parent': 'Yaw', 'contact': ''},
+    ]
+
+    resolve_family_ids(records)
+
+    families = {f.number: (f.parent, f.contact) for f in session.query(Family)}
+    assert families == {'7': ('Ama', '0244'), '8': (None, None), '9': ('Esi', '0555')}
+    ids = dict(session.query(Family.number, Family.id))
+    assert [r['family_id'] for r in records] == [ids['7'], ids['7'], ids['8'], ids['9'], ids['9'], None]
@@ -0,0 +1,30 @@
+from sqlalchemy import text
+
+from app import db, Student, migrate_indexes, missing_indexes, warn_missing_indexes
+
+ROSTER_INDEXES = ['ix_student_status_class', 'ix_student_status_family']
+
+
+def query_plan(query):
+    compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return ' '.join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+
+def test_missing_roster_indexes_are_reported_and_created(session, capsys):
+    for name in ROSTER_INDEXES:
+        session.execute(text(f"DROP INDEX {name}"))
+    session.commit()
+
+    assert [index.name for index in missing_indexes()] == ROSTER_INDEXES
+    warn_missing_indexes()
+    assert 'ix_student_status_class, ix_student_status_family' in capsys.readouterr().out
+
+    migrate_indexes()
+    assert missing_indexes() == []
+    migrate_indexes()   # Safe to run again
+
+
+def test_active_roster_queries_use_the_composite_indexes(session):
+    active = Student.query.filter_by(status='active')
+    assert 'ix_student_status_class' in query_plan(active.filter_by(student_class='Psalms'))
+    assert 'ix_student_status_family' in query_plan(active.filter_by(family_id=3))
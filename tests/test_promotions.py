@@ -0,0 +1,34 @@
+from datetime import date
+
+from sqlalchemy import event
+
+from app import db, Student, apply_promotions, plan_promotions
+
+
+def test_promotions_move_every_class_in_one_update(session, add_student):
+    today = date(2026, 9, 1)
+    add_student('Toddler', dob=date(2022, 1, 1), student_class='Psalms')
+    add_student('Seven', dob=date(2019, 1, 1), student_class='Genesis')
+    add_student('Twelve', dob=date(2014, 1, 1), student_class='Psalms')
+    add_student('Settled', dob=date(2018, 1, 1))
+    add_student('Unknown', dob=None, student_class='Exodus')
+    add_student('Away', dob=date(2010, 1, 1), status='inactive')
+    session.commit()
+
+    plan = plan_promotions(today)
+    assert [item['student'].name for item in plan if item['needs_promotion']] == ['Seven', 'Toddler', 'Twelve']
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert apply_promotions(plan) == 3
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    session.commit()
+
+    assert [s.split()[0] for s in statements] == ['UPDATE']
+    assert dict(session.query(Student.name, Student.student_class)) == {
+        'Toddler': 'Genesis', 'Seven': 'Exodus', 'Twelve': 'Revelation',
+        'Settled': 'Psalms', 'Unknown': 'Exodus', 'Away': 'Psalms',
+    }
@@ -0,0 +1,49 @@
+from datetime import date
+
+import pytest
+
+from app import Attendance, ATTENDANCE_BATCH_MAX
+
+
+@pytest.fixture
+def roster(session, add_student):
+    students = [add_student('ruth'), add_student('Abel'), add_student('Cain', student_class='Exodus'),
+                add_student('Leaving', deletion_requested=True)]
+    # Sunday 8 March 2026
+    session.add_all([Attendance(student_id=students[0].id, date=date(2026, 3, 8), present=True),
+                     Attendance(student_id=students[1].id, date=date(2026, 3, 1), present=True)])
+    session.commit()
+    return students
+
+
+def test_teacher_gets_their_own_class(roster, signed_in_client, set_today):
+    set_today(date(2026, 3, 8))
+    client = signed_in_client('teacher', 'Psalms')
+
+    roll = client.get('/roll_call?format=json&class_name=Exodus').get_json()
+
+    assert roll['class_name'] == 'Psalms' and roll['date'] == '2026-03-08' and roll['editable']
+    assert [(s['name'], s['present']) for s in roll['students']] == [('Abel', False), ('ruth', True)]
+    assert roll['present_count'] == 1
+
+
+def test_admin_chooses_a_class_and_past_sundays_are_read_only(roster, signed_in_client, set_today):
+    set_today(date(2026, 3, 11))
+    client = signed_in_client('admin')
+
+    roll = client.get('/roll_call?format=json&class_name=Exodus').get_json()
+    assert roll['class_name'] == 'Exodus' and roll['date'] == '2026-03-08' and not roll['editable']
+    assert [s['name'] for s in roll['students']] == ['Cain']
+
+    assert client.get('/roll_call?format=json').get_json()['students'] == []
+
+
+def test_roll_call_and_dashboard_share_the_attendance_queue(roster, signed_in_client, set_today):
+    set_today(date(2026, 3, 8))
+    client = signed_in_client('admin')
+
+    page = client.get('/roll_call?class_name=Psalms').get_data(as_text=True)
+    assert f'data-batch-max="{ATTENDANCE_BATCH_MAX}"' in page
+    assert page.index('js/attendance_queue.js') < page.index('js/roll_call.js')
+    dashboard = client.get('/dashboard').get_data(as_text=True)
+    assert dashboard.index('js/attendance_queue.js') < dashboard.index('createAttendanceQueue(')
@@ -0,0 +1,63 @@
+from datetime import date
+
+from app import Family, Attendance, AttendanceBits
+
+def test_marks_come_from_attendance_without_bitsets(session, add_student, signed_in_client):
+    # March 2026 Sundays: the 1st, 8th, 15th, 22nd and 29th
+    ruth, abel = add_student('Ruth'), add_student('Abel')
+    session.add_all([Attendance(student_id=ruth.id, date=date(2026, 3, 8), present=True),
+                     Attendance(student_id=ruth.id, date=date(2026, 3, 29), present=True),
+                     Attendance(student_id=abel.id, date=date(2026, 3, 8), present=False)])
+    session.commit()
+    assert session.query(AttendanceBits).count() == 0
+
+    client = signed_in_client()
+    page = client.get('/roster?month=3&year=2026').get_json()
+    assert {s['name']: s['present'] for s in page['students']} == {'Ruth': 0b10010, 'Abel': 0}
+
+    # The full render lists the same students in the same order
+    html = client.get('/dashboard?month=3&year=2026&rows=all').get_data(as_text=True)
+    assert html.index('Ruth') < html.index('Abel')
+    assert [s['name'] for s in page['students']] == ['Ruth', 'Abel']
+
+
+def test_search_filters_pages_not_yet_loaded(session, add_student, signed_in_client):
+    family = Family(number='120')
+    other = Family(number='7')
+    session.add_all([family, other])
+    session.flush()
+    add_student('Student 0', family_id=other.id)
+    for i in range(1, 5):
+        add_student(f'Student {i}')
+    add_student('Ruth', family_id=family.id)
+    session.commit()
+
+    client = signed_in_client()
+    # The only match sits on the last page of an unfiltered walk
+    page = client.get('/roster?limit=2&search=rut').get_json()
+    assert [s['name'] for s in page['students']] == ['Ruth'] and page['next'] is None
+
+    page = client.get('/roster?limit=2&family_prefix=12').get_json()
+    assert [s['name'] for s in page['students']] == ['Ruth']
+
+    assert client.get('/roster?search=100%25').get_json()['students'] == []
+
+
+def test_cursor_walks_the_roster_once(session, add_student, signed_in_client):
+    students = [add_student(f'Student {i}') for i in range(5)]
+    add_student('Other', student_class='Exodus')
+    session.commit()
+
+    client = signed_in_client('teacher', 'Psalms')
+    seen, after, pages = [], '', 0
+    while True:
+        page = client.get(f'/roster?limit=2&after={after}').get_json()
+        seen += [s['id'] for s in page['students']]
+        pages += 1
+        if not page['next']:
+            break
+        after = page['next']
+
+    # Teachers default to their own class
+    assert seen == [s.id for s in students] and pages == 3
+    assert client.get('/roster?limit=x').status_code == 400
@@ -0,0 +1,40 @@
+import app as register
+from app import app, Family
+
+
+def test_batch_details_by_ids_and_class(session, add_student, signed_in_client):
+    family = Family(number='12')
+    session.add(family)
+    session.flush()
+    ruth = add_student('Ruth', family_id=family.id, profile_image='ruth.png')
+    abel = add_student('Abel', student_class='Exodus', status='inactive')
+    add_student('Cain', student_class='Exodus')
+    session.commit()
+    client = signed_in_client()
+
+    students = client.get(f'/get_students?ids={ruth.id}, {abel.id}&ids=999').get_json()['students']
+    assert [s['name'] for s in students] == ['Abel', 'Ruth']
+    assert students[1] == {
+        'id': ruth.id, 'name': 'Ruth', 'dob': '2018-05-01', 'parent': None, 'contact': None,
+        'student_class': 'Psalms', 'status': 'active', 'family_id': '12', 'profile_image': 'ruth.png',
+        'profile_image_url': '/static/uploads/profiles/ruth.png',
+    }
+
+    # A class lists its active students; fields narrow each entry (the id always comes back)
+    students = client.get('/get_students?class_name=Exodus&fields=name').get_json()['students']
+    assert [set(s) for s in students] == [{'id', 'name'}]
+    assert students[0]['name'] == 'Cain'
+
+
+def test_batch_details_rejects_bad_requests(session, signed_in_client, monkeypatch):
+    monkeypatch.setattr(register, 'STUDENT_BATCH_MAX', 2)
+    assert app.test_client().get('/get_students?ids=1').status_code == 401
+    client = signed_in_client()
+
+    assert client.get('/get_students').status_code == 400
+    assert client.get('/get_students?ids=1,x').status_code == 400
+    response = client.get('/get_students?ids=1,2,3')
+    assert response.status_code == 400 and 'At most 2' in response.get_json()['error']
+    response = client.get('/get_students?ids=1&fields=name,secret')
+    assert response.status_code == 400 and response.get_json()['error'] == 'Unknown fields: secret'
+    assert client.get('/get_students?ids=1,1,2').status_code == 200
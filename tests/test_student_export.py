@@ -0,0 +1,50 @@
+from datetime import date, datetime
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+from app import Family, STUDENT_EXPORT_HEADER
+
+
+def test_download_round_trips_families_in_page_order(session, add_student, signed_in_client):
+    seven, hundred = Family(number='7', parent='Ama Ofori', contact='0244'), Family(number='100')
+    session.add_all([seven, hundred])
+    session.flush()
+    add_student('Kofi', family_id=hundred.id, parent='Kwame', contact='0555', dob=date(2019, 2, 3))
+    add_student('abena', family_id=seven.id, student_class='Genesis')
+    add_student('Yaw', family_id=seven.id)
+    add_student('Loner', parent=None)
+    add_student('Other class', family_id=seven.id, student_class='Exodus')
+    session.commit()
+
+    response = signed_in_client().get('/download_students?sort_by=name')
+    assert response.status_code == 200
+    sheet = load_workbook(BytesIO(response.data))['Students']
+    rows = list(sheet.iter_rows(values_only=True))
+
+    assert rows[0] == tuple(STUDENT_EXPORT_HEADER)
+    assert sheet['A1'].font.bold and sheet['A2'].font.bold and not sheet['A3'].font.bold
+    birth = datetime(2018, 5, 1)
+    assert [row for row in rows[1:] if any(row)] == [
+        # Numeric family numbers in numeric order; a family's own parent/contact win
+        ('Family 7', None, None, None, 'Ama Ofori', '0244'),
+        (None, '  • abena', 'Genesis', birth, None, None),
+        (None, '  • Other class', 'Exodus', birth, None, None),
+        (None, '  • Yaw', 'Psalms', birth, None, None),
+        # A family without details shows its first student's
+        ('Family 100', None, None, None, 'Kwame', '0555'),
+        (None, '  • Kofi', 'Psalms', datetime(2019, 2, 3), None, None),
+        ('Family No Family ID', None, None, None, 'N/A', 'N/A'),
+        (None, '  • Loner', 'Psalms', birth, None, None),
+    ]
+    assert sheet.column_dimensions['B'].width == len('  • Other class') + 2
+
+
+def test_download_follows_the_class_filter(session, add_student, signed_in_client):
+    add_student('Ruth')
+    add_student('Abel', student_class='Exodus')
+    session.commit()
+
+    response = signed_in_client().get('/download_students?class_name=Exodus')
+    names = [row[1] for row in load_workbook(BytesIO(response.data))['Students'].iter_rows(min_row=2, values_only=True)]
+    assert [name for name in names if name] == ['  • Abel']
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import app as register
+from app import (Student, StudentImport, IMPORT_BATCH_SIZE, IMPORT_STALE_SECONDS,
+                 claim_student_import, run_student_import)
+
+
+def test_decode_error_keeps_committed_rows(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(register, 'IMPORT_FOLDER', str(tmp_path))
+    job = StudentImport(file_hash='0' * 64, file_type='csv')
+    session.add(job)
+    session.commit()
+
+    rows = ['Name,Age', ',6'] + [f'Student {i},6' for i in range(IMPORT_BATCH_SIZE * 40)]
+    with open(job.file_path, 'wb') as f:
+        f.write('\n'.join(rows).encode('utf-8') + '\nJos\xe9,6\n'.encode('latin-1'))
+
+    run_student_import(job)
+
+    assert job.status == 'failed'
+    assert job.inserted >= IMPORT_BATCH_SIZE
+    assert session.query(Student).count() == job.inserted
+    errors = job.error_list
+    assert errors[0] == {'row': 2, 'name': '', 'error': 'Name is required.'}
+    assert errors[-1]['row'] == job.rows_done + 1
+    assert 'UTF-8' in errors[-1]['error']
+    assert f"Rows 2 to {job.rows_done} were processed (see the errors above)" in errors[-1]['error']
+    assert job.failed == len(errors) == 2
+
+
+def test_only_one_request_claims_a_job(session):
+    job = StudentImport(file_hash='1' * 64, file_type='csv', status='running')
+    session.add(job)
+    session.commit()
+
+    assert claim_student_import(job, ['running'])
+    assert job.status == 'importing' and not job.resumable
+    assert not claim_student_import(job, ['running'])
+
+    # A request that died mid-import leaves the job claimable once it goes stale
+    job.updated_at = datetime.now() - timedelta(seconds=IMPORT_STALE_SECONDS + 1)
+    session.commit()
+    assert job.resumable
+    assert claim_student_import(job, ['running'])
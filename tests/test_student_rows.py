@@ -0,0 +1,31 @@
+from app import Family, Student, StudentRow, student_row_query, student_rows
+
+
+def test_rows_read_only_the_listed_columns_without_entities(session, add_student):
+    family = Family(number='4')
+    session.add(family)
+    session.flush()
+    add_student('Ruth', family_id=family.id, parent='Naomi')
+    add_student('Abel')
+    session.commit()
+    session.expunge_all()
+
+    rows = student_rows(student_row_query(Student.query).order_by(Student.name))
+
+    assert all(type(row) is StudentRow for row in rows)
+    assert [(row.name, row.parent, row.family_number) for row in rows] == [('Abel', None, None), ('Ruth', 'Naomi', '4')]
+    assert len(session.identity_map) == 0
+
+
+def test_manage_status_lists_rows_by_status(session, add_student, signed_in_client):
+    add_student('Zechariah')
+    add_student('amos')
+    add_student('Cain', status='inactive')
+    add_student('Seth', status='deleted')
+    session.commit()
+
+    page = signed_in_client().get('/manage_status').get_data(as_text=True)
+
+    # Case-insensitive name order, as the (status, lower(name)) index serves it
+    assert page.index('amos') < page.index('Zechariah')
+    assert 'Cain' in page and 'Seth' not in page
@@ -0,0 +1,56 @@
+from app import Family, Student, migrate_student_search, search_students
+
+
+def names(query):
+    return [student.name for student in query]
+
+
+def test_index_is_filled_on_first_run_and_kept_in_sync(session, add_student):
+    add_student('Abigail Mensah', parent='Grace Mensah')
+    migrate_student_search()
+    active = Student.query.filter_by(status='active')
+    assert names(search_students(active, 'abig')) == ['Abigail Mensah']
+
+    family = Family(number='120')
+    session.add(family)
+    session.flush()
+    add_student('Kofi Boateng', family_id=family.id)
+    session.flush()
+    assert names(search_students(active, '120')) == ['Kofi Boateng']
+
+    family.number = '121'
+    Student.query.filter_by(name='Abigail Mensah').one().name = 'Abena Mensah'
+    session.flush()
+    assert names(search_students(active, '121')) == ['Kofi Boateng']
+    assert names(search_students(active, 'abig')) == []
+    assert names(search_students(active, 'abe mens')) == ['Abena Mensah']
+
+
+def test_ranked_search_puts_the_best_match_first_and_punctuation_falls_back(session, add_student):
+    migrate_student_search()
+    add_student('Mary Ofori', parent='Ama Ofori')
+    add_student('Ama Owusu', parent='Kwame Owusu')
+    add_student("D'Souza", parent='Rita')
+    session.flush()
+    active = Student.query.filter_by(status='active')
+
+    assert set(names(search_students(active, 'ama'))) == {'Mary Ofori', 'Ama Owusu'}
+    assert names(search_students(active, 'ama owusu', ranked=True)) == ['Ama Owusu']
+    assert names(search_students(active, 'ama', ranked=True).limit(1)) == ['Ama Owusu']
+    # Only punctuation gives the index no words; the substring match still finds it
+    assert names(search_students(active, "'")) == ["D'Souza"]
+
+
+def test_typeahead_returns_active_matches_in_a_class(session, add_student, signed_in_client):
+    migrate_student_search()
+    add_student('Esi Asante')
+    add_student('Esi Appiah', student_class='Genesis')
+    add_student('Esi Amoah', status='inactive')
+    session.commit()
+    client = signed_in_client()
+
+    results = client.get('/search_students?q=esi').get_json()['results']
+    assert {r['name'] for r in results} == {'Esi Asante', 'Esi Appiah'}
+    results = client.get('/search_students?q=esi&class_name=Genesis').get_json()['results']
+    assert [r['name'] for r in results] == ['Esi Appiah']
+    assert client.get('/search_students?q=').get_json() == {'results': []}